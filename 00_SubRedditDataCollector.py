@@ -1,8 +1,14 @@
 import praw
+import prawcore
+import requests
 from datetime import datetime, timedelta
 import os
 import json
 import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 
@@ -21,110 +27,544 @@ load_dotenv()
 # 5. Create a file ".env" with variables shown in .env-template
 # 6. Paste the values for client_id, client_secret, username, and password into the environment file.
 
+# Number of comment trees fetched at the same time
+MAX_COMMENT_WORKERS = 8
+
+# Rate limiter defaults, used until Reddit has sent its first rate-limit headers
+DEFAULT_REQUESTS_PER_SECOND = 1.0
+MAX_BURST = 10  # Maximum number of requests that may be sent back to back
+MAX_RETRIES = 5  # Retries after a 429 "Too Many Requests" response
+BACKOFF_BASE = 2.0  # Seconds, doubled on every retry
+
+
+# Token bucket shared by every thread of the collector
+# The refill rate follows Reddit's x-ratelimit-* response headers: the remaining requests are spread
+# over the seconds left until the quota resets, so the budget is spent as fast as it is allowed to.
+class AdaptiveRateLimiter:
+    def __init__(self, default_rate=DEFAULT_REQUESTS_PER_SECOND, max_burst=MAX_BURST,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+        self._lock = threading.Lock()
+        self.default_rate = default_rate
+        self.rate = default_rate  # Tokens per second
+        self.max_burst = max_burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0  # Set after a 429 response or when the quota is used up
+
+        # Quota as reported by the last response
+        self.remaining = None
+        self.used = None
+        self.reset_at = None
+
+        # Counters
+        self.start_time = time.monotonic()
+        self.requests = 0
+        self.throttled_requests = 0
+        self.wait_seconds = 0.0
+
+    # Hook for requests.Session: read the quota from every response
+    def update_from_response(self, response, *args, **kwargs):
+        headers = response.headers
+        if "x-ratelimit-remaining" not in headers:
+            return
+        now = time.monotonic()
+        remaining = float(headers["x-ratelimit-remaining"])
+        used = int(float(headers.get("x-ratelimit-used", 0)))
+        seconds_to_reset = max(1.0, float(headers.get("x-ratelimit-reset", 1)))
+
+        with self._lock:
+            self.remaining = remaining
+            self.used = used
+            self.reset_at = now + seconds_to_reset
+            self.rate = max(remaining, 1.0) / seconds_to_reset
+            if remaining < 1:
+                self.blocked_until = max(self.blocked_until, self.reset_at)
+
+    # Block until the bucket holds a token, then take it
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.max_burst, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+
+                if self.reset_at is not None and now >= self.reset_at:
+                    # The quota window is over, wait for the next headers to learn the new quota
+                    self.remaining = None
+                    self.reset_at = None
+                    self.rate = self.default_rate
+
+                if now < self.blocked_until:
+                    wait_time = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    if self.remaining is not None:
+                        self.remaining -= 1  # Account for requests still in flight
+                        if self.remaining < 1 and self.reset_at is not None:
+                            self.blocked_until = self.reset_at
+                    return
+                else:
+                    wait_time = (1 - self.tokens) / self.rate
+
+                self.wait_seconds += wait_time
+            time.sleep(wait_time)
+
+    # Run a function that sends one API request, retrying with jittered backoff on 429 responses
+    def call(self, function, *args):
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            try:
+                return function(*args)
+            except prawcore.exceptions.TooManyRequests as error:
+                if attempt == self.max_retries:
+                    raise
+                backoff = self.backoff_base * 2 ** attempt
+                if error.retry_after:
+                    backoff = max(backoff, float(error.retry_after))
+                backoff += random.uniform(0, backoff)  # Jitter, so the workers don't retry in lockstep
+                print(f"Rate limited by Reddit, retrying in {backoff:.1f} seconds...")
+                with self._lock:
+                    self.throttled_requests += 1
+                    self.tokens = 0.0
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + backoff)
+
+    # Counters to see where collection time goes
+    def stats(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.start_time
+            return {
+                "requests": self.requests,
+                "requests_per_second": self.requests / elapsed if elapsed > 0 else 0.0,
+                "throttled_requests": self.throttled_requests,
+                "wait_seconds": self.wait_seconds,
+                "elapsed_seconds": elapsed,
+                "quota_remaining": self.remaining,
+                "quota_used": self.used,
+            }
+
+
+# Every API call of this script goes through this rate limiter
+rate_limiter = AdaptiveRateLimiter()
+
+
 # Reddit API configuration
-reddit = praw.Reddit(
-    client_id=os.getenv('REDDIT_CLIENT_ID'),
-    client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
-    user_agent="local research script",
-    username=os.getenv('REDDIT_USERNAME'),
-    password=os.getenv('REDDIT_PASSWORD')
-)
+# PRAW is not thread-safe, so every thread gets its own instance with its own HTTP session.
+# All of them report to the shared rate limiter.
+def create_reddit():
+    http_session = requests.Session()
+    http_session.hooks["response"].append(rate_limiter.update_from_response)
+    return praw.Reddit(
+        client_id=os.getenv('REDDIT_CLIENT_ID'),
+        client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
+        user_agent="local research script",
+        username=os.getenv('REDDIT_USERNAME'),
+        password=os.getenv('REDDIT_PASSWORD'),
+        requestor_kwargs={"session": http_session}
+    )
+
+
+# Instance of the main thread, used for the listing
+reddit = create_reddit()
+
+# Instance of a comment worker thread, created by init_comment_worker
+worker_state = threading.local()
+
+
+# Initializer of the comment worker pool
+def init_comment_worker():
+    worker_state.reddit = create_reddit()
+
+
+# Reddit instance of the current thread (the main thread's instance outside the worker pool)
+def get_thread_reddit():
+    return getattr(worker_state, "reddit", reddit)
+
+
+# Fetch the flattened comment tree of a submission (one API request)
+def fetch_comments(submission):
+    submission.comments.replace_more(limit=0)  # Remove "load more comments" placeholders
+    return submission.comments.list()
+
+
+# Fetch one page of the "new" listing (one API request)
+def fetch_listing_page(subreddit, after):
+    return list(subreddit.new(limit=100, params={"after": after}))
+
+
+# Build the JSON structure for a single submission, including all of its comments
+# Runs inside the comment worker pool. The listing's submission belongs to the main thread's Reddit instance,
+# so only its already loaded fields are read here and the comments are fetched through the worker's own instance.
+def build_post_with_comments(submission):
+    # Fetch comments for the submission
+    submission_comments = []
+    comment_submission = get_thread_reddit().submission(id=submission.id)
+
+    for comment in rate_limiter.call(fetch_comments, comment_submission):
+        submission_comments.append({
+            "id": comment.id,
+            "body": comment.body,
+            "author": comment.author.name if comment.author else None,
+            "created_utc": comment.created_utc,
+            "upvotes": comment.score
+        })
+
+    # Add the post along with its embedded comments
+    return {
+        "id": submission.id,
+        "title": submission.title,
+        "selftext": submission.selftext,
+        "author": submission.author.name if submission.author else None,
+        "created_utc": submission.created_utc,
+        "upvotes": submission.score,
+        "num_comments": submission.num_comments,
+        "flair": submission.link_flair_text,
+        "comments": submission_comments  # Embed comments directly here
+    }
+
+
+# Split the date range into day windows, newest day first
+# Each window is (day, start_timestamp, end_timestamp) and covers start_timestamp <= created_utc < end_timestamp
+def build_day_windows(p_start_date, p_end_date):
+    day_windows = []
+    current_date = p_end_date  # Start from the end date
+
+    while current_date > p_start_date:
+        previous_date = current_date - timedelta(days=1)
+        day_windows.append((previous_date.date(), int(previous_date.timestamp()), int(current_date.timestamp())))
+        current_date = previous_date  # Move to the previous day
+
+    return day_windows
+
+
+# Path of the collector state file of a subreddit
+def get_state_filename(p_subreddit_name):
+    return f"data/{p_subreddit_name}_collector_state.json"
+
+
+# Load the collector state: the newest fetched created_utc (high-water mark) and the completed days
+def load_collector_state(p_subreddit_name):
+    state_filename = get_state_filename(p_subreddit_name)
+    if not os.path.exists(state_filename):
+        return {"newest_created_utc": None, "completed_days": []}
+    with open(state_filename, "r") as state_file:
+        return json.load(state_file)
+
+
+# Save the collector state, replacing the old file atomically so a crash never leaves a broken state
+def save_collector_state(p_subreddit_name, p_state):
+    state_filename = get_state_filename(p_subreddit_name)
+    with open(state_filename + ".tmp", "w") as state_file:
+        json.dump(p_state, state_file, indent=4)
+    os.replace(state_filename + ".tmp", state_filename)
+
+
+# Path of the file holding the posts of a single day, extension is "json" or "ndjson"
+def get_day_filename(p_subreddit_name, p_day, p_extension):
+    return f"data/{p_subreddit_name}_posts_with_comments_{p_day}.{p_extension}"
+
+
+# Load the posts of a day saved by an earlier run (in either format), an empty list if there is no file
+def load_day_posts(p_subreddit_name, p_day):
+    for extension in DAY_WRITERS:
+        filename = get_day_filename(p_subreddit_name, p_day, extension)
+        if not os.path.exists(filename):
+            continue
+        with open(filename, "r", encoding="utf-8") as posts_file:
+            if extension == "json":
+                return json.load(posts_file)
+            return [json.loads(line) for line in posts_file if line.strip()]
+    return []
+
+
+# Posts of an earlier run that are missing from this run's posts of the day (kept when a day is merged)
+def get_earlier_posts(p_subreddit_name, p_day, p_post_ids):
+    return [post for post in load_day_posts(p_subreddit_name, p_day) if post["id"] not in p_post_ids]
+
+
+# Collects the posts of a day in memory and saves them as a single JSON list in the "data" directory
+class JsonDayWriter:
+    extension = "json"
+
+    def __init__(self, p_subreddit_name, p_day):
+        self.filename = get_day_filename(p_subreddit_name, p_day, self.extension)
+        self.other_filename = get_day_filename(p_subreddit_name, p_day, NdjsonDayWriter.extension)
+        self.subreddit_name = p_subreddit_name
+        self.day = p_day
+        self.posts_list = []  # List to store posts with embedded comments
+        self.post_ids = set()
+        self.num_posts = 0
+        self.num_comments = 0
+        self.num_kept_posts = 0  # Posts of an earlier run kept by a merge
+        self.newest_created_utc = None
+
+    def write(self, p_post):
+        self.posts_list.append(p_post)
+        self.post_ids.add(p_post["id"])
+        self.num_posts += 1
+        self.num_comments += len(p_post["comments"])
+        if self.newest_created_utc is None or p_post["created_utc"] > self.newest_created_utc:
+            self.newest_created_utc = p_post["created_utc"]
+
+    # Save the day, with p_merge the posts of an earlier run that this run didn't receive are kept
+    def close(self, p_merge=False):
+        if p_merge:
+            earlier_posts = get_earlier_posts(self.subreddit_name, self.day, self.post_ids)
+            self.posts_list.extend(earlier_posts)
+            self.num_kept_posts = len(earlier_posts)
+        with open(self.filename + ".tmp", "w") as posts_file:
+            # noinspection PyTypeChecker
+            # intellij bug
+            json.dump(self.posts_list, posts_file)
+        os.replace(self.filename + ".tmp", self.filename)
+        self.posts_list = []
+
+        # A day is stored in one format only, otherwise loaders would read it twice
+        if os.path.exists(self.other_filename):
+            os.remove(self.other_filename)
+
+    # Drop the day without touching an existing file
+    def discard(self):
+        self.posts_list = []
+
+
+# Appends every post of a day as one JSON line (NDJSON) as soon as its comments have arrived
+# The lines go to a ".part" file, which is fsynced when the day is finished and then renamed atomically
+class NdjsonDayWriter:
+    extension = "ndjson"
+
+    def __init__(self, p_subreddit_name, p_day):
+        self.filename = get_day_filename(p_subreddit_name, p_day, self.extension)
+        self.other_filename = get_day_filename(p_subreddit_name, p_day, JsonDayWriter.extension)
+        self.part_filename = self.filename + ".part"
+        self.subreddit_name = p_subreddit_name
+        self.day = p_day
+        self.posts_file = open(self.part_filename, "w", encoding="utf-8")
+        self.post_ids = set()
+        self.num_posts = 0
+        self.num_comments = 0
+        self.num_kept_posts = 0  # Posts of an earlier run kept by a merge
+        self.newest_created_utc = None
+
+    def write(self, p_post):
+        self.posts_file.write(json.dumps(p_post) + "\n")
+        self.post_ids.add(p_post["id"])
+        self.num_posts += 1
+        self.num_comments += len(p_post["comments"])
+        if self.newest_created_utc is None or p_post["created_utc"] > self.newest_created_utc:
+            self.newest_created_utc = p_post["created_utc"]
+
+    # Save the day, with p_merge the posts of an earlier run that this run didn't receive are kept
+    def close(self, p_merge=False):
+        if p_merge:
+            earlier_posts = get_earlier_posts(self.subreddit_name, self.day, self.post_ids)
+            for post in earlier_posts:
+                self.posts_file.write(json.dumps(post) + "\n")
+            self.num_kept_posts = len(earlier_posts)
+        self.posts_file.flush()
+        os.fsync(self.posts_file.fileno())
+        self.posts_file.close()
+        os.replace(self.part_filename, self.filename)
+
+        # A day is stored in one format only, otherwise loaders would read it twice
+        if os.path.exists(self.other_filename):
+            os.remove(self.other_filename)
+
+    # Drop the day without touching an existing file
+    def discard(self):
+        self.posts_file.close()
+        os.remove(self.part_filename)
+
+
+DAY_WRITERS = {"json": JsonDayWriter, "ndjson": NdjsonDayWriter}
 
 
 # Fetch posts from a subreddit and embeds their comments directly into a JSON structure
 # Note: In the current implementation, all comments, including replies to other comments,
 # are stored in a flat structure under the "comments" field for each post.
+#
+# The "new" listing is walked only once, from the newest to the oldest submission. Every submission
+# is sent to the bucket of its day, and a day is saved as soon as the crawl has passed its start.
+# The crawl stops as soon as created_utc goes past the oldest day window.
+#
+# Comment trees are fetched by a bounded worker pool while the crawl continues. Posts keep the
+# listing order inside each day, so the daily JSON files are the same as with a serial fetch.
+# Listing and comment requests share the budget of the global rate limiter.
+#
+# In incremental mode the day windows are calendar days and progress is kept in a state file per
+# subreddit (see load_collector_state). Days that are already complete are skipped, and the crawl
+# stops at the oldest day that is still missing or incomplete. A day counts as complete once it is
+# over and the crawl has passed its start. The state is saved after every day, so an interrupted
+# backfill resumes from the last completed day. Days that are over but incomplete are fetched again
+# as a whole, so their comments are up to date. On the day that isn't over yet (e.g. today), the crawl
+# stops at the newest created_utc of the last run (high-water mark) once no older day is missing, so
+# repeated runs during a day only fetch the new submissions.
+#
+# Only days that received posts in this run are written. A day the crawl has passed replaces its
+# file, a day it hasn't passed (stopped at the high-water mark, or the listing doesn't reach back that
+# far) is merged with its existing file, so an earlier run's posts are never lost.
 
-def fetch_submissions_with_comments(p_subreddit_name, p_start_date, p_end_date):
+def fetch_submissions_with_comments(p_subreddit_name, p_start_date, p_end_date, p_max_workers=MAX_COMMENT_WORKERS,
+                                    p_incremental=True, p_output_format="json"):
     subreddit = reddit.subreddit(p_subreddit_name)  # Connect to the subreddit
-    current_date = p_end_date  # Start from the end date
+    day_writer_class = DAY_WRITERS[p_output_format]
+    run_timestamp = datetime.now().timestamp()
     total_days = 0
     total_posts = 0
     total_comments = 0
+    listing_requests = 0
 
     # Ensure the "data" directory exists
     os.makedirs("data", exist_ok=True)
 
+    if p_incremental:
+        # Align the day windows to calendar days, so a day always covers the same time span
+        p_end_date = datetime.combine(p_end_date.date() + timedelta(days=1), datetime.min.time())
+        state = load_collector_state(p_subreddit_name)
+    else:
+        state = {"newest_created_utc": None, "completed_days": []}
+    completed_days = set(state["completed_days"])
+    previous_newest_created_utc = state["newest_created_utc"]
 
-    while current_date > p_start_date:
-        previous_date = current_date - timedelta(days=1)
-        start_timestamp = int(previous_date.timestamp())
-        end_timestamp = int(current_date.timestamp())
+    # Only crawl down to the oldest day that still has to be fetched
+    day_windows = build_day_windows(p_start_date, p_end_date)
+    missing_indexes = [index for index, window in enumerate(day_windows) if str(window[0]) not in completed_days]
+    day_windows = day_windows[:missing_indexes[-1] + 1] if missing_indexes else []
+    print(f"{len(missing_indexes)} day(s) missing or incomplete, {len(completed_days)} day(s) already complete.")
 
-        posts_list = []  # List to store posts with embedded comments
+    day_index = 0  # Index of the day window the crawl is currently in
+    current_day = None  # Collected day of the current window, None if the day is skipped
+    pending_days = deque()  # Days whose posts have not all been written yet, in crawl order
+    after = None  # For pagination
 
-        print(f"Fetching posts and comments for {previous_date.date()}...")
+    # Start collecting the day of the current window
+    def start_day():
+        day = day_windows[day_index][0]
+        if str(day) in completed_days:
+            print(f"Skipping {day}, already complete.")
+            return None
 
-        after = None  # For pagination
+        print(f"Fetching posts and comments for {day}...")
+        pending_day = {
+            "day": day,
+            "futures": deque(),  # Comment fetches of the day, in listing order
+            "writer": day_writer_class(p_subreddit_name, day),
+            "finished": False,  # True once the crawl has moved on to the previous day
+            "passed": False,  # True if the crawl has seen a submission older than the start of the day
+            "complete": False  # True if the day can be skipped on later runs
+        }
+        pending_days.append(pending_day)
+        return pending_day
 
-        while True:
+    # Finish the current day and move on to the previous one
+    # p_passed: True if the crawl has seen a submission older than the start of the day
+    def finish_day(p_passed):
+        nonlocal day_index, current_day
+        if current_day is not None:
+            current_day["finished"] = True
+            current_day["passed"] = p_passed
+            current_day["complete"] = p_incremental and p_passed and day_windows[day_index][2] <= run_timestamp
+        day_index += 1
+        current_day = start_day() if day_index < len(day_windows) else None
+
+    # Write fetched posts in order and close finished days, optionally waiting for the comment fetches
+    def write_fetched_posts(wait):
+        nonlocal total_days, total_posts, total_comments
+        while pending_days:
+            pending_day = pending_days[0]
+            futures = pending_day["futures"]
+            while futures and (wait or futures[0].done()):
+                pending_day["writer"].write(futures.popleft().result())
+            if futures or not pending_day["finished"]:
+                break  # Keep the order of the days
+
+            pending_days.popleft()
+            writer = pending_day["writer"]
+            if writer.num_posts == 0:
+                # Never replace an existing file with an empty day
+                writer.discard()
+                print(f"No posts received for {pending_day['day']}, file left unchanged.")
+            else:
+                writer.close(p_merge=not pending_day["passed"])
+                kept = f", kept {writer.num_kept_posts} posts of an earlier run" if writer.num_kept_posts else ""
+                print(f"Saved file: {writer.filename} with {writer.num_posts} posts and {writer.num_comments} "
+                      f"comments for {pending_day['day']}{kept}.")
+                total_posts += writer.num_posts
+                total_comments += writer.num_comments
+                total_days += 1
+
+            # Record the progress
+            if p_incremental:
+                if writer.newest_created_utc is not None and (state["newest_created_utc"] is None
+                                                              or writer.newest_created_utc > state["newest_created_utc"]):
+                    state["newest_created_utc"] = writer.newest_created_utc
+                if pending_day["complete"]:
+                    completed_days.add(str(pending_day["day"]))
+                    state["completed_days"] = sorted(completed_days)
+                save_collector_state(p_subreddit_name, state)
+
+    if day_windows:
+        current_day = start_day()
+    reached_high_water_mark = False
+
+    with ThreadPoolExecutor(max_workers=p_max_workers, initializer=init_comment_worker) as executor:
+        while day_index < len(day_windows):
             # Fetch submissions with pagination
-            submissions = list(subreddit.new(limit=100, params={"after": after}))
+            submissions = rate_limiter.call(fetch_listing_page, subreddit, after)
+            listing_requests += 1
             if not submissions:
                 print("No more posts available for the current pagination.")
                 break  # Exit the loop if no posts are available
 
             for submission in submissions:
-                # Filter submissions by timestamp
-                if start_timestamp <= submission.created_utc < end_timestamp:
-                    # Fetch comments for the submission
-                    submission.comments.replace_more(limit=0)  # Remove "load more comments" placeholders
-                    submission_comments = []
-
-                    for comment in submission.comments.list():
-                        submission_comments.append({
-                            "id": comment.id,
-                            "body": comment.body,
-                            "author": comment.author.name if comment.author else None,
-                            "created_utc": comment.created_utc,
-                            "upvotes": comment.score
-                        })
-
-                    # Add the post along with its embedded comments
-                    posts_list.append({
-                        "id": submission.id,
-                        "title": submission.title,
-                        "selftext": submission.selftext,
-                        "author": submission.author.name if submission.author else None,
-                        "created_utc": submission.created_utc,
-                        "upvotes": submission.score,
-                        "num_comments": submission.num_comments,
-                        "flair": submission.link_flair_text,
-                        "comments": submission_comments  # Embed comments directly here
-                    })
+                # Finish every day the crawl has passed, the listing is ordered from newest to oldest
+                while day_index < len(day_windows) and submission.created_utc < day_windows[day_index][1]:
+                    finish_day(p_passed=True)
 
-            # Pagination: Update "after" for the next batch of submissions
-            if len(submissions) > 0:
-                after = submissions[-1].fullname
-            else:
-                break
+                if day_index >= len(day_windows):
+                    break  # The crawl went past the start date
 
-            # Respect Reddit API rate limits
-            time.sleep(1)
+                # Submissions up to the high-water mark were fetched by an earlier run. On the oldest day that
+                # is still needed, and only while that day isn't over, the crawl can stop there.
+                if (previous_newest_created_utc is not None
+                        and submission.created_utc <= previous_newest_created_utc
+                        and day_index == len(day_windows) - 1 and day_windows[day_index][2] > run_timestamp):
+                    print(f"Reached the high-water mark of the last run in {day_windows[day_index][0]}.")
+                    reached_high_water_mark = True
+                    break
 
-        # Save the results for the current day into a single JSON file in the "data" directory
-        posts_filename = f"data/{p_subreddit_name}_posts_with_comments_{previous_date.date()}.json"
+                # Skip submissions newer than the end date and submissions of completed days
+                if current_day is not None and submission.created_utc < day_windows[day_index][2]:
+                    current_day["futures"].append(executor.submit(build_post_with_comments, submission))
 
-        with open(posts_filename, "w") as posts_file:
-            # noinspection PyTypeChecker
-            # intellij bug
-            json.dump(posts_list, posts_file)
+            write_fetched_posts(wait=False)
 
-        # Calculate and display the number of posts and comments for the day
-        num_posts = len(posts_list)
-        num_comments = sum(len(post["comments"]) for post in posts_list)
-        total_posts += num_posts
-        total_comments += num_comments
+            if day_index >= len(day_windows) or reached_high_water_mark:
+                break  # No need to request another page
+
+            # Pagination: Update "after" for the next batch of submissions
+            after = submissions[-1].fullname
 
-        print(f"Saved file: {posts_filename} with {num_posts} posts and {num_comments} comments for {previous_date.date()}.")
+        # Finish the remaining days, including days the listing no longer reaches (they are merged, not replaced)
+        while day_index < len(day_windows):
+            finish_day(p_passed=False)
+        write_fetched_posts(wait=True)
 
-        # Move to the previous day
-        current_date = previous_date
-        total_days += 1
+    if p_incremental and state["newest_created_utc"] is not None:
+        if previous_newest_created_utc is None or state["newest_created_utc"] > previous_newest_created_utc:
+            newest = datetime.fromtimestamp(state["newest_created_utc"])
+            print(f"Newest fetched submission is now from {newest} (high-water mark).")
 
     # Summary of the entire operation
-    print(f"Finished fetching data for {total_days} day(s).")
+    request_stats = rate_limiter.stats()
+    print(f"Finished fetching data for {total_days} day(s) with {listing_requests} listing request(s).")
     print(f"Total posts: {total_posts}, Total comments: {total_comments}.")
+    print(f"API requests: {request_stats['requests']} ({request_stats['requests_per_second']:.2f}/s), "
+          f"waited {request_stats['wait_seconds']:.1f}s for the rate limit, "
+          f"{request_stats['throttled_requests']} request(s) throttled by Reddit.")
+    return request_stats
 
     # Main function
 if __name__ == "__main__":
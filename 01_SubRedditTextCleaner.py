@@ -1,19 +1,19 @@
 import os
 import json
 import re
+import pickle
+import hashlib
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from spacy.lang.de.stop_words import STOP_WORDS as GERMAN_STOPWORDS
 from spacy.lang.en.stop_words import STOP_WORDS as ENGLISH_STOPWORDS
+from SubRedditCorpusLoader import (load_corpus, list_daily_files, iter_posts_from_file, get_cache_key, load_cleaned_index,
+                                   DAILY_FILE_PREFIX, CLEANED_DIRECTORY, CLEANED_INDEX_FILENAME, CLEANED_VARIANTS,
+                                   get_flair_slug)
 
-# Function to load data
+# Function to load data (daily JSON or NDJSON files of the collector, cached)
 def load_data(directory):
-    all_posts = []
-    for filename in os.listdir(directory):
-        if filename.startswith("austria_posts_with_comments_") and filename.endswith(".json"):
-            with open(os.path.join(directory, filename), "r", encoding="utf-8") as file:
-                data = json.load(file)
-                all_posts.extend(data)
-    return all_posts
+    return load_corpus(directory)
 
 # Load stopwords for German and English with custom additions
 def get_multilingual_stopwords():
@@ -25,29 +25,60 @@ def get_multilingual_stopwords():
     return GERMAN_STOPWORDS.union(ENGLISH_STOPWORDS).union(custom_stopwords)
 
 
-# Function to preprocess text
-def preprocess_text(text, custom_stopwords=None):
+# Patterns used to clean texts, compiled once
+URL_PATTERN = re.compile(r'http\S+')
+NON_ALPHABETIC_PATTERN = re.compile(r'[^a-zA-ZäöüÄÖÜß\s]')
 
-    if custom_stopwords is None:
-        custom_stopwords = set()
 
-    # Combine custom stopwords with German and English stopwords
-    stopwords = GERMAN_STOPWORDS.union(ENGLISH_STOPWORDS).union(custom_stopwords)
+# Text normalizer: the stopword set and the patterns are built once and reused for every text
+class TextNormalizer:
+    def __init__(self, custom_stopwords=None):
+        if custom_stopwords is None:
+            custom_stopwords = set()
+
+        # Combine custom stopwords with German and English stopwords
+        self.stopwords = frozenset(GERMAN_STOPWORDS.union(ENGLISH_STOPWORDS).union(custom_stopwords))
+
+    # Split a text into cleaned tokens without stopwords
+    def tokenize(self, text):
+        # Remove URLs and non-alphabetic characters (texts without "http" can't contain a URL)
+        if "http" in text:
+            text = URL_PATTERN.sub('', text)
+        text = NON_ALPHABETIC_PATTERN.sub('', text)
+
+        # Convert text to lowercase
+        text = text.lower()
+
+        # Tokenize and remove stopwords
+        stopwords = self.stopwords
+        return [word for word in text.split() if len(word) > 2 and word not in stopwords]
+
+    # Clean a single text, same result as preprocess_text
+    def normalize(self, text):
+        return " ".join(self.tokenize(text))
 
-    # Remove URLs and non-alphabetic characters
-    text = re.sub(r'http\S+', '', text)
-    text = re.sub(r'[^a-zA-ZäöüÄÖÜß\s]', '', text)
+    # Clean a list of texts
+    def normalize_batch(self, texts):
+        normalize = self.normalize
+        return [normalize(text) for text in texts]
 
-    # Convert text to lowercase
-    text = text.lower()
 
-    # Tokenize and remove stopwords
-    tokens = [word for word in text.split() if word not in stopwords and len(word) > 2]
-    return " ".join(tokens)
+# Normalizer without custom stopwords, shared by all calls of preprocess_text
+DEFAULT_NORMALIZER = TextNormalizer()
+
+
+# Function to preprocess text
+def preprocess_text(text, custom_stopwords=None):
+    if custom_stopwords is None:
+        return DEFAULT_NORMALIZER.normalize(text)
+    return TextNormalizer(custom_stopwords).normalize(text)
 
 # Clean and filter data
 def clean_and_filter_data(posts, remove_stopwords=False, custom_stopwords=None, show_statistics=True):
 
+    # Build the normalizer once for all posts and comments
+    normalizer = TextNormalizer(custom_stopwords) if remove_stopwords else DEFAULT_NORMALIZER
+
     cleaned_posts = []
     empty_posts_count = 0
     empty_comments_count = 0
@@ -59,17 +90,18 @@ def clean_and_filter_data(posts, remove_stopwords=False, custom_stopwords=None,
             continue  # Skip empty posts
 
         # Clean comments
+        post_comments = post.get("comments", [])
+        cleaned_bodies = normalizer.normalize_batch([comment.get("body", "") for comment in post_comments])
         comments = []
-        for comment in post.get("comments", []):
-            cleaned_body = preprocess_text(comment.get("body", ""), custom_stopwords) if remove_stopwords else preprocess_text(comment.get("body", ""))
+        for comment, cleaned_body in zip(post_comments, cleaned_bodies):
             if not cleaned_body.strip():
                 empty_comments_count += 1
                 continue  # Skip empty comments
             comments.append({**comment, "cleaned_body": cleaned_body})
 
         # Clean post title and selftext
-        cleaned_title = preprocess_text(post.get("title", ""), custom_stopwords) if remove_stopwords else preprocess_text(post.get("title", ""))
-        cleaned_selftext = preprocess_text(post.get("selftext", ""), custom_stopwords) if remove_stopwords else preprocess_text(post.get("selftext", ""))
+        cleaned_title = normalizer.normalize(post.get("title", ""))
+        cleaned_selftext = normalizer.normalize(post.get("selftext", ""))
 
         cleaned_posts.append({
             **post,
@@ -85,11 +117,312 @@ def clean_and_filter_data(posts, remove_stopwords=False, custom_stopwords=None,
 
     return cleaned_posts
 
+# Store of the incremental cleaning (one entry per daily file), in the directory of the flair partitions
+CLEANED_STORE_DIRECTORY = ".store"
+
+# Stopwords of the "no stopwords" variant, set once per process by init_cleaning_worker
+_worker_stopwords = None
+
+
+# Set up a worker process of the parallel cleaner
+def init_cleaning_worker(custom_stopwords):
+    global _worker_stopwords
+    _worker_stopwords = TextNormalizer(custom_stopwords).stopwords
+
+
+# Clean a chunk of texts into both variants, one (with stopwords, without stopwords) pair per text
+# Every text is tokenized once: the "with stopwords" variant keeps the default stopword filtering of
+# preprocess_text, the "no stopwords" variant additionally drops the custom stopwords from the same tokens.
+def clean_texts_chunk(texts):
+    all_stopwords = _worker_stopwords
+    tokenize = DEFAULT_NORMALIZER.tokenize
+
+    cleaned = []
+    for text in texts:
+        tokens = tokenize(text)
+        cleaned.append((" ".join(tokens), " ".join([token for token in tokens if token not in all_stopwords])))
+    return cleaned
+
+
+# Clean texts into both variants in a process pool, results are in the order of the texts
+def clean_texts_parallel(texts, custom_stopwords=None, workers=None, chunk_size=2000):
+    workers = workers or os.cpu_count()
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_cleaning_worker,
+                                 initargs=(custom_stopwords,)) as executor:
+            cleaned_chunks = list(executor.map(clean_texts_chunk, chunks))  # map keeps the order of the chunks
+    else:
+        init_cleaning_worker(custom_stopwords)
+        cleaned_chunks = [clean_texts_chunk(chunk) for chunk in chunks]
+
+    return [cleaned for cleaned_chunk in cleaned_chunks for cleaned in cleaned_chunk]
+
+
+# Hash of the stopword sets, the store is only valid for the stopwords it was cleaned with
+def get_stopwords_hash(custom_stopwords=None):
+    stopwords = " ".join(sorted(DEFAULT_NORMALIZER.stopwords)) + "|" + " ".join(sorted(TextNormalizer(custom_stopwords).stopwords))
+    return hashlib.blake2b(stopwords.encode("utf-8"), digest_size=16).digest()
+
+
+# Store of the incremental cleaning, one small pickle per daily file of the collector
+# The entry of a day holds the loader's cache key of the file (name, size and modification time), the hash of the
+# stopwords and the flair partition files written for the day. Days whose file and stopwords did not change are
+# neither read nor cleaned again, and their partition files stay as they are.
+class CleanedTextStore:
+    def __init__(self, custom_stopwords=None, directory=CLEANED_DIRECTORY):
+        self.directory = os.path.join(directory, CLEANED_STORE_DIRECTORY)
+        self.stopwords_hash = get_stopwords_hash(custom_stopwords)
+
+    def get_path(self, day):
+        return os.path.join(self.directory, day + ".pkl")
+
+    # Days with an entry
+    def days(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(filename[:-len(".pkl")] for filename in os.listdir(self.directory) if filename.endswith(".pkl"))
+
+    def load(self, day):
+        with open(self.get_path(day), "rb") as file:
+            return pickle.load(file)
+
+    def save(self, day, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.get_path(day)
+        with open(path + ".tmp", "wb") as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def remove(self, day):
+        os.remove(self.get_path(day))
+
+    # An entry is only valid for the same daily file and the same stopwords
+    def is_current(self, entry, cache_key):
+        return entry["cache_key"] == cache_key and entry["stopwords_hash"] == self.stopwords_hash
+
+
+# Posts without title and selftext are skipped by the cleaners
+def is_empty_post(post):
+    return not post.get("title", "").strip() and not post.get("selftext", "").strip()
+
+
+# Clean and filter data in a process pool and return both variants (with and without stopwords)
+# Same results as clean_and_filter_data with remove_stopwords=False and remove_stopwords=True,
+# in the original order of the posts.
+def clean_and_filter_data_parallel(posts, custom_stopwords=None, workers=None, chunk_size=2000, show_statistics=True):
+    # Skip empty posts before anything is sent to the workers
+    empty_posts_count = 0
+    kept_posts = []
+    for post in posts:
+        if is_empty_post(post):
+            empty_posts_count += 1
+            continue
+        kept_posts.append(post)
+
+    # Only the texts go to the workers, the posts are put together again here
+    texts = []
+    for post in kept_posts:
+        texts.append(post.get("title", ""))
+        texts.append(post.get("selftext", ""))
+        texts.extend(comment.get("body", "") for comment in post.get("comments", []))
+    cleaned_texts = clean_texts_parallel(texts, custom_stopwords, workers, chunk_size)
+
+    cleaned_posts = []
+    cleaned_no_stopwords_posts = []
+    empty_comments_counts = [0, 0]
+    cleaned_iterator = iter(cleaned_texts)
+    for post in kept_posts:
+        cleaned_title = next(cleaned_iterator)
+        cleaned_selftext = next(cleaned_iterator)
+        cleaned_bodies = [next(cleaned_iterator) for _ in post.get("comments", [])]
+        for variant, variant_posts in enumerate((cleaned_posts, cleaned_no_stopwords_posts)):
+            comments = []
+            for comment, cleaned_body in zip(post.get("comments", []), cleaned_bodies):
+                if not cleaned_body[variant].strip():
+                    empty_comments_counts[variant] += 1
+                    continue  # Skip empty comments
+                comments.append({**comment, "cleaned_body": cleaned_body[variant]})
+
+            variant_posts.append({
+                **post,
+                "cleaned_title": cleaned_title[variant],
+                "cleaned_selftext": cleaned_selftext[variant],
+                "comments": comments
+            })
+
+    # Display statistics only if show_statistics is True
+    if show_statistics:
+        print(f"Empty posts removed: {empty_posts_count}")
+        print(f"Empty comments removed: {empty_comments_counts[0]} (with stopwords), "
+              f"{empty_comments_counts[1]} (without stopwords)")
+
+    return cleaned_posts, cleaned_no_stopwords_posts
+
 # Save cleaned data
 def save_cleaned_data(posts, filename):
     with open(filename, "w", encoding="utf-8") as file:
         json.dump(posts, file, ensure_ascii=False, indent=4)
 
+# Day of a daily file, e.g. "2024-01-01", used in the names of the partition files and of the store entries
+def get_day_name(filepath):
+    return os.path.splitext(os.path.basename(filepath))[0][len(DAILY_FILE_PREFIX):]
+
+
+# Slug of a flair that is not used by another flair yet (different flairs can end up with the same slug)
+def get_unique_slug(flair, slugs):
+    used_slugs = set(slugs.values())
+    slug = base_slug = get_flair_slug(flair)
+    suffix = 2
+    while slug in used_slugs:
+        slug = f"{base_slug}_{suffix}"
+        suffix += 1
+    return slug
+
+
+# Write both cleaned variants of a day partitioned by flair: "<slug>/<day>.ndjson" and "<slug>/<day>_no_stopwords.ndjson"
+# (compact NDJSON, one post per line). Both lists have to come from clean_and_filter_data_parallel (same posts in the
+# same order). slugs maps flairs to their slugs, new flairs are added to it. Returns the partitions of the day.
+def write_day_partitions(day, cleaned_posts, cleaned_no_stopwords_posts, slugs, directory=CLEANED_DIRECTORY):
+    # Group posts by flair in a single pass, keeping their order within each flair
+    grouped = {}
+    for post, no_stopwords_post in zip(cleaned_posts, cleaned_no_stopwords_posts):
+        flair = post.get("flair")
+        if flair not in grouped:
+            grouped[flair] = ([], [])
+        grouped[flair][0].append(post)
+        grouped[flair][1].append(no_stopwords_post)
+
+    partitions = {}
+    for flair, variant_posts in grouped.items():
+        if flair not in slugs:
+            slugs[flair] = get_unique_slug(flair, slugs)
+        os.makedirs(os.path.join(directory, slugs[flair]), exist_ok=True)
+
+        files = {}
+        for variant, posts in zip(CLEANED_VARIANTS, variant_posts):
+            filename = f"{day}.ndjson" if variant == "stopwords" else f"{day}_{variant}.ndjson"
+            files[variant] = os.path.join(slugs[flair], filename)
+            filepath = os.path.join(directory, files[variant])
+            with open(filepath + ".tmp", "w", encoding="utf-8") as file:
+                for post in posts:
+                    file.write(json.dumps(post, ensure_ascii=False, separators=(",", ":")) + "\n")
+            os.replace(filepath + ".tmp", filepath)
+
+        partitions[flair] = {
+            "slug": slugs[flair],
+            "posts": len(variant_posts[0]),
+            "comments": {variant: sum(len(post.get("comments", [])) for post in posts)
+                         for variant, posts in zip(CLEANED_VARIANTS, variant_posts)},
+            "files": files
+        }
+    return partitions
+
+
+# Remove the partition files of a store entry, except those that are also files of keep_entry
+# Flair directories that end up empty are removed as well.
+def remove_partition_files(entry, directory=CLEANED_DIRECTORY, keep_entry=None):
+    keep_files = set()
+    if keep_entry is not None:
+        keep_files = {filename for partition in keep_entry["partitions"].values()
+                      for filename in partition["files"].values()}
+
+    for partition in entry["partitions"].values():
+        for filename in partition["files"].values():
+            filepath = os.path.join(directory, filename)
+            if filename not in keep_files and os.path.exists(filepath):
+                os.remove(filepath)
+        flair_directory = os.path.join(directory, partition["slug"])
+        if os.path.isdir(flair_directory) and not os.listdir(flair_directory):
+            os.rmdir(flair_directory)
+
+
+# Index of the flair partitions from the store entries of all days
+# Every partition lists the files of its days in date order, so reading them in order gives the posts of the
+# flair in the order of the corpus.
+def build_partition_index(entries):
+    partitions = {}
+    for day in sorted(entries):
+        for flair, day_partition in entries[day]["partitions"].items():
+            if flair not in partitions:
+                partitions[flair] = {"flair": flair, "slug": day_partition["slug"], "posts": 0,
+                                     "comments": {variant: 0 for variant in CLEANED_VARIANTS},
+                                     "files": {variant: [] for variant in CLEANED_VARIANTS}}
+            partition = partitions[flair]
+            partition["posts"] += day_partition["posts"]
+            for variant in CLEANED_VARIANTS:
+                partition["comments"][variant] += day_partition["comments"][variant]
+                partition["files"][variant].append(day_partition["files"][variant])
+    return {"partitions": list(partitions.values())}
+
+
+# Clean the daily files of the collector into flair partitions with one file per flair, day and variant
+# Only days whose file is new or changed, or that were cleaned with other stopwords, are read, cleaned (in one
+# parallel pass) and written, so a run costs as much as the changed days. Files of other days stay as they are,
+# and a run without changes writes nothing at all. With incremental=False, all days are cleaned again.
+# Returns the index of the partitions.
+def update_flair_partitions(data_directory, custom_stopwords=None, directory=CLEANED_DIRECTORY, incremental=True,
+                            workers=None, chunk_size=2000, show_statistics=True):
+    store = CleanedTextStore(custom_stopwords, directory)
+    stored_days = set(store.days())
+    days = {get_day_name(filepath): filepath for filepath in list_daily_files(data_directory)}
+
+    entries = {}  # Entries of the unchanged days
+    changed_days = []  # (day, cache key, previous entry)
+    for day, filepath in days.items():
+        cache_key = get_cache_key(filepath)
+        entry = store.load(day) if day in stored_days else None
+        if incremental and entry is not None and store.is_current(entry, cache_key):
+            entries[day] = entry
+        else:
+            changed_days.append((day, cache_key, entry))
+    removed_days = sorted(stored_days - set(days))
+
+    if show_statistics:
+        print(f"Days cleaned: {len(changed_days)}, taken from the store: {len(entries)}, removed: {len(removed_days)}")
+    index_path = os.path.join(directory, CLEANED_INDEX_FILENAME)
+    if not changed_days and not removed_days and os.path.exists(index_path):
+        return load_cleaned_index(directory)
+
+    # Flairs of unchanged days keep their slugs, so their files stay valid
+    slugs = {flair: partition["slug"] for entry in entries.values() for flair, partition in entry["partitions"].items()}
+
+    # Clean all changed days together, then split the cleaned posts by day again
+    day_posts = [list(iter_posts_from_file(days[day])) for day, _, _ in changed_days]
+    cleaned_posts, cleaned_no_stopwords_posts = [], []
+    if changed_days:
+        cleaned_posts, cleaned_no_stopwords_posts = clean_and_filter_data_parallel(
+            [post for posts in day_posts for post in posts], custom_stopwords, workers, chunk_size, show_statistics)
+    start = 0
+    for (day, cache_key, previous_entry), posts in zip(changed_days, day_posts):
+        end = start + sum(1 for post in posts if not is_empty_post(post))
+        entry = {"cache_key": cache_key, "stopwords_hash": store.stopwords_hash,
+                 "partitions": write_day_partitions(day, cleaned_posts[start:end], cleaned_no_stopwords_posts[start:end],
+                                                    slugs, directory)}
+        if previous_entry is not None:
+            remove_partition_files(previous_entry, directory, keep_entry=entry)
+        store.save(day, entry)
+        entries[day] = entry
+        start = end
+
+    for day in removed_days:
+        remove_partition_files(store.load(day), directory)
+        store.remove(day)
+
+    # The index is written last, readers only see complete partitions
+    index = build_partition_index(entries)
+    with open(index_path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(index, file, ensure_ascii=False, indent=4)
+    os.replace(index_path + ".tmp", index_path)
+
+    # Partitions of the former layout (one file per flair and variant) are replaced by the per-day files
+    for filename in os.listdir(directory):
+        if filename.endswith(".ndjson"):
+            os.remove(os.path.join(directory, filename))
+
+    return index
+
 # Analyze and print statistics
 def analyze_data(posts):
     total_posts = len(posts)
@@ -107,6 +440,19 @@ def analyze_data(posts):
     for flair, count in sorted(flairs.items(), key=lambda x: x[1], reverse=True)[:5]:
         print(f"  {flair}: {count} posts")
 
+# Print the statistics of analyze_data from the counts in the index of the flair partitions
+# Only the partitions of the given flairs are counted (None counts all of them).
+def analyze_index(index, flairs=None):
+    partitions = [partition for partition in index["partitions"] if flairs is None or partition["flair"] in flairs]
+    flair_counts = {partition["flair"]: partition["posts"] for partition in partitions if partition["flair"]}
+
+    print(f"Total posts: {sum(partition['posts'] for partition in partitions)}")
+    print(f"Total comments: {sum(partition['comments']['stopwords'] for partition in partitions)}")
+    print(f"Flairs found: {len(flair_counts)}")
+    print("Top flairs:")
+    for flair, count in sorted(flair_counts.items(), key=lambda x: x[1], reverse=True)[:5]:
+        print(f"  {flair}: {count} posts")
+
 # Main function
 if __name__ == "__main__":
     # Directory containing the JSON files
@@ -116,38 +462,18 @@ if __name__ == "__main__":
     stopwords = get_multilingual_stopwords()
     print(stopwords)
 
-    # Output filenames
-    cleaned_all_filename = os.path.join(data_directory, "cleaned_all.json")
-    cleaned_all_no_stopwords_filename = os.path.join(data_directory, "cleaned_all_no_stopwords.json")
-
     input_flair_name = "Politik | Politics"
-    output_flair_name = "politics"
+    incremental = True  # Reuse cleaned texts of earlier runs
 
-    # Load data
-    print("Loading data...")
-    posts = load_data(data_directory)
-
-    # Clean and save all posts
+    # Clean all posts (including comments) into both variants in one parallel pass and save them partitioned by flair
+    # In incremental mode only new or changed days are cleaned and only their partition files are written
     print("\nCleaning all posts (including comments)...")
-    cleaned_all_posts = clean_and_filter_data(posts, remove_stopwords=False, custom_stopwords=stopwords, show_statistics=True)
-    save_cleaned_data(cleaned_all_posts, cleaned_all_filename)
-    print(f"Cleaned all posts saved to {cleaned_all_filename}.")
-
-    cleaned_all_no_stopwords_posts = clean_and_filter_data(posts, remove_stopwords=True, custom_stopwords=stopwords, show_statistics=False)
-    save_cleaned_data(cleaned_all_no_stopwords_posts, cleaned_all_no_stopwords_filename)
-    print(f"Cleaned all posts without stopwords saved to {cleaned_all_no_stopwords_filename}.")
-
-    # Filter posts with specific flair
-    flair_posts = [post for post in cleaned_all_posts if post.get("flair") == input_flair_name]
-    flair_no_stopwords_posts = [post for post in cleaned_all_no_stopwords_posts if post.get("flair") == input_flair_name]
-
-    # Save filtered flair-specific posts
-    save_cleaned_data(flair_posts, os.path.join(data_directory, f"cleaned_{output_flair_name}.json"))
-    save_cleaned_data(flair_no_stopwords_posts, os.path.join(data_directory, f"cleaned_{output_flair_name}_no_stopwords.json"))
+    index = update_flair_partitions(data_directory, stopwords, CLEANED_DIRECTORY, incremental=incremental)
+    print(f"Cleaned posts saved to {CLEANED_DIRECTORY} ({len(index['partitions'])} flair partitions).")
 
     # Analyze all posts and specific flair
     print("\nStatistics for all posts:")
-    analyze_data(cleaned_all_posts)
+    analyze_index(index)
 
     print(f"\nStatistics for flair '{input_flair_name}':")
-    analyze_data(flair_posts)
+    analyze_index(index, [input_flair_name])
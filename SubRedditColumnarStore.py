@@ -0,0 +1,185 @@
+import os
+import json
+from datetime import datetime, timezone
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from SubRedditCorpusLoader import DAILY_FILE_PREFIX, list_daily_files, iter_posts_from_file
+
+# Columnar copy of the collector output: one table for posts and one for comments
+# Both tables are Parquet files with one row group per daily file, so filters on "date" or "flair"
+# can skip whole row groups (predicate pushdown) and only the requested columns are decoded.
+COLUMNAR_DIR = os.path.join("data", "columnar")
+POSTS_TABLE = "posts.parquet"
+COMMENTS_TABLE = "comments.parquet"
+
+POSTS_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("title", pa.string()),
+    ("selftext", pa.string()),
+    ("author", pa.string()),
+    ("created_utc", pa.float64()),
+    ("date", pa.date32()),  # UTC date of created_utc
+    ("upvotes", pa.int64()),
+    ("num_comments", pa.int64()),  # As reported by Reddit
+    ("comment_count", pa.int64()),  # Number of collected comments
+    ("flair", pa.string()),
+])
+
+COMMENTS_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("post_id", pa.string()),
+    ("flair", pa.string()),  # Flair of the post
+    ("post_date", pa.date32()),  # UTC date of the post
+    ("body", pa.string()),
+    ("author", pa.string()),
+    ("created_utc", pa.float64()),
+    ("date", pa.date32()),  # UTC date of the comment
+    ("upvotes", pa.int64()),
+])
+
+
+# Convert a UNIX timestamp to its UTC date
+def utc_date(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).date()
+
+
+# Build the posts and comments record batches of a single daily file
+def build_record_batches(filepath):
+    posts = {name: [] for name in POSTS_SCHEMA.names}
+    comments = {name: [] for name in COMMENTS_SCHEMA.names}
+
+    for post in iter_posts_from_file(filepath):
+        post_date = utc_date(post.get("created_utc", 0))
+        post_comments = post.get("comments", [])
+        posts["id"].append(post.get("id"))
+        posts["title"].append(post.get("title"))
+        posts["selftext"].append(post.get("selftext"))
+        posts["author"].append(post.get("author"))
+        posts["created_utc"].append(post.get("created_utc", 0))
+        posts["date"].append(post_date)
+        posts["upvotes"].append(post.get("upvotes", 0))
+        posts["num_comments"].append(post.get("num_comments", 0))
+        posts["comment_count"].append(len(post_comments))
+        posts["flair"].append(post.get("flair"))
+
+        for comment in post_comments:
+            comments["id"].append(comment.get("id"))
+            comments["post_id"].append(post.get("id"))
+            comments["flair"].append(post.get("flair"))
+            comments["post_date"].append(post_date)
+            comments["body"].append(comment.get("body"))
+            comments["author"].append(comment.get("author"))
+            comments["created_utc"].append(comment.get("created_utc", 0))
+            comments["date"].append(utc_date(comment.get("created_utc", 0)))
+            comments["upvotes"].append(comment.get("upvotes", 0))
+
+    return (pa.RecordBatch.from_pydict(posts, schema=POSTS_SCHEMA),
+            pa.RecordBatch.from_pydict(comments, schema=COMMENTS_SCHEMA))
+
+
+# Key of the list of source files in the schema metadata of both tables
+SOURCE_FILES_METADATA_KEY = b"source_files"
+
+
+# List of the daily files a store is built from, as [name, size, modification time in ns] per file
+def get_source_files(data_directory="data", prefix=DAILY_FILE_PREFIX):
+    source_files = []
+    for filepath in list_daily_files(data_directory, prefix):
+        file_stat = os.stat(filepath)
+        source_files.append([os.path.basename(filepath), file_stat.st_size, file_stat.st_mtime_ns])
+    return source_files
+
+
+# Convert the daily files of the collector into the columnar posts and comments tables
+# Daily files are processed one at a time, so only a single day is held in memory. The list of daily files
+# (see get_source_files) is stored in the schema metadata of both tables.
+def convert_to_columnar(data_directory="data", store_directory=COLUMNAR_DIR, prefix=DAILY_FILE_PREFIX):
+    os.makedirs(store_directory, exist_ok=True)
+    source_files = get_source_files(data_directory, prefix)
+    metadata = {SOURCE_FILES_METADATA_KEY: json.dumps(source_files).encode("utf-8")}
+    posts_path = os.path.join(store_directory, POSTS_TABLE)
+    comments_path = os.path.join(store_directory, COMMENTS_TABLE)
+    num_posts = 0
+    num_comments = 0
+
+    # Write to temporary files first, so readers never see a half-written store
+    with pq.ParquetWriter(posts_path + ".tmp", POSTS_SCHEMA.with_metadata(metadata)) as posts_writer, \
+            pq.ParquetWriter(comments_path + ".tmp", COMMENTS_SCHEMA.with_metadata(metadata)) as comments_writer:
+        for name, _, _ in source_files:
+            filepath = os.path.join(data_directory, name)
+            posts_batch, comments_batch = build_record_batches(filepath)
+            posts_writer.write_batch(posts_batch)
+            comments_writer.write_batch(comments_batch)
+            num_posts += posts_batch.num_rows
+            num_comments += comments_batch.num_rows
+
+    os.replace(posts_path + ".tmp", posts_path)
+    os.replace(comments_path + ".tmp", comments_path)
+    print(f"Columnar store written to {store_directory} with {num_posts} posts and {num_comments} comments.")
+
+
+# Check if the columnar store is missing or was built from other daily files than the current ones
+# Daily files that were added, changed, deleted or renamed all change the list of source files. Only the
+# Parquet footers are read for this.
+def is_columnar_store_outdated(data_directory="data", store_directory=COLUMNAR_DIR, prefix=DAILY_FILE_PREFIX):
+    store_paths = [os.path.join(store_directory, POSTS_TABLE), os.path.join(store_directory, COMMENTS_TABLE)]
+    if not all(os.path.exists(path) for path in store_paths):
+        return True
+    source_files = get_source_files(data_directory, prefix)
+    for path in store_paths:
+        metadata = pq.read_schema(path).metadata or {}
+        if SOURCE_FILES_METADATA_KEY not in metadata:
+            return True  # Written before the list of source files was stored
+        if json.loads(metadata[SOURCE_FILES_METADATA_KEY]) != source_files:
+            return True
+    return False
+
+
+# Build a filter expression on the "date" and "flair" columns (None means no restriction)
+def build_filter(start_date=None, end_date=None, flairs=None, date_column="date"):
+    conditions = []
+    if start_date is not None:
+        conditions.append(ds.field(date_column) >= start_date)
+    if end_date is not None:
+        conditions.append(ds.field(date_column) <= end_date)
+    if flairs is not None:
+        conditions.append(ds.field("flair").isin(list(flairs)))
+    if not conditions:
+        return None
+
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+# Load a table of the columnar store
+# The file is memory-mapped, only the given columns are read and row groups that can't match are skipped
+def load_table(table_name, columns=None, start_date=None, end_date=None, flairs=None, date_column="date",
+               store_directory=COLUMNAR_DIR):
+    path = os.path.join(store_directory, table_name)
+    return pq.read_table(path, columns=columns, filters=build_filter(start_date, end_date, flairs, date_column),
+                         memory_map=True)
+
+
+# Load the posts table, e.g. load_posts_table(columns=["date", "upvotes"], flairs=["Politik | Politics"])
+def load_posts_table(columns=None, start_date=None, end_date=None, flairs=None, store_directory=COLUMNAR_DIR):
+    return load_table(POSTS_TABLE, columns, start_date, end_date, flairs, "date", store_directory)
+
+
+# Load the comments table, dates filter on the date of the post like the daily statistics do
+def load_comments_table(columns=None, start_date=None, end_date=None, flairs=None, store_directory=COLUMNAR_DIR):
+    return load_table(COMMENTS_TABLE, columns, start_date, end_date, flairs, "post_date", store_directory)
+
+
+# Make sure the columnar store is up to date with the daily files
+def ensure_columnar_store(data_directory="data", store_directory=COLUMNAR_DIR):
+    if is_columnar_store_outdated(data_directory, store_directory):
+        print("Columnar store missing or outdated, converting daily files...")
+        convert_to_columnar(data_directory, store_directory)
+
+
+# Main function
+if __name__ == "__main__":
+    convert_to_columnar("data", COLUMNAR_DIR)
@@ -0,0 +1,185 @@
+import os
+import re
+import gc
+import json
+import pickle
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+# Faster JSON parsers are used when they are installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Daily files written by the SubRedditDataCollector, either as one JSON list or as NDJSON (one post per line)
+DAILY_FILE_PREFIX = "austria_posts_with_comments_"
+DAILY_FILE_EXTENSIONS = (".json", ".ndjson")
+
+# Binary cache of the parsed daily files, one pickle per daily file
+CACHE_DIRECTORY_NAME = ".cache"
+
+# Flair-partitioned output of the text cleaner, one compact NDJSON file per flair and variant plus an index
+CLEANED_DIRECTORY = os.path.join("data", "cleaned")
+CLEANED_INDEX_FILENAME = "index.json"
+CLEANED_VARIANTS = ("stopwords", "no_stopwords")
+
+# JSON parsers by name, all of them take the raw bytes of a document
+JSON_BACKENDS = {"json": json.loads}
+if msgspec is not None:
+    JSON_BACKENDS["msgspec"] = msgspec.json.decode
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = orjson.loads
+DEFAULT_JSON_BACKEND = "orjson" if orjson is not None else "msgspec" if msgspec is not None else "json"
+
+
+# List the daily files of the collector in a directory, ordered by date (the date is part of the file name)
+def list_daily_files(directory, prefix=DAILY_FILE_PREFIX):
+    return sorted(
+        os.path.join(directory, filename)
+        for filename in os.listdir(directory)
+        if filename.startswith(prefix) and filename.endswith(DAILY_FILE_EXTENSIONS)
+    )
+
+
+# Stream the posts of a single daily file
+def iter_posts_from_file(filepath, json_backend=DEFAULT_JSON_BACKEND):
+    loads = JSON_BACKENDS[json_backend]
+    with open(filepath, "rb") as file:
+        if filepath.endswith(".ndjson"):
+            # One post per line, only a single post is held in memory at a time
+            for line in file:
+                if line.strip():
+                    yield loads(line)
+        else:
+            yield from loads(file.read())
+
+
+# Stream the posts of all daily files in a directory
+def iter_posts(directory, prefix=DAILY_FILE_PREFIX, verbose=False, json_backend=DEFAULT_JSON_BACKEND):
+    for filepath in list_daily_files(directory, prefix):
+        if verbose:
+            print(f"Loading file: {filepath}")
+        yield from iter_posts_from_file(filepath, json_backend)
+
+
+# Cache key of a daily file, a hash of its name, size and modification time
+def get_cache_key(filepath):
+    file_stat = os.stat(filepath)
+    key = f"{os.path.basename(filepath)}:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+# Cache directory of the parsed daily files with a prefix, every prefix has its own subdirectory so loads of
+# different prefixes (or other caches in "<directory>/.cache") never remove each other's entries
+def get_corpus_cache_directory(directory, prefix=DAILY_FILE_PREFIX):
+    return os.path.join(directory, CACHE_DIRECTORY_NAME, "corpus", prefix)
+
+
+# Parse a daily file and optionally store the result in the cache (runs in the loader's process pool)
+def parse_daily_file(filepath, cache_path=None, json_backend=DEFAULT_JSON_BACKEND):
+    posts = list(iter_posts_from_file(filepath, json_backend))
+    if cache_path is not None:
+        with open(cache_path + ".tmp", "wb") as file:
+            pickle.dump(posts, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_path + ".tmp", cache_path)
+    return posts
+
+
+# Load all posts of the daily files in a directory (shared loader of all scripts)
+# Parsed files are cached in "<directory>/.cache/corpus/<prefix>". Only days whose file changed (name, size or
+# modification time) are parsed again, cache entries of changed or deleted days of the prefix are removed.
+# With workers > 1, files that have to be parsed are parsed in a process pool. Posts are always
+# merged in date order, independent of the order in which the files are parsed.
+def load_corpus(directory, prefix=DAILY_FILE_PREFIX, use_cache=True, workers=1, json_backend=DEFAULT_JSON_BACKEND,
+                verbose=False):
+    daily_files = list_daily_files(directory, prefix)
+    cache_directory = get_corpus_cache_directory(directory, prefix)
+    cache_paths = [None] * len(daily_files)
+    if use_cache:
+        os.makedirs(cache_directory, exist_ok=True)
+        cache_paths = [os.path.join(cache_directory, get_cache_key(filepath) + ".pkl") for filepath in daily_files]
+
+    day_posts = [None] * len(daily_files)
+    to_parse = [index for index, cache_path in enumerate(cache_paths)
+                if cache_path is None or not os.path.exists(cache_path)]
+
+    # Unpickling many small dicts is a lot faster without the garbage collector running in between
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        # Parse new or changed days
+        if workers > 1 and len(to_parse) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed = executor.map(parse_daily_file, [daily_files[index] for index in to_parse],
+                                      [cache_paths[index] for index in to_parse],
+                                      [json_backend] * len(to_parse))
+                for index, posts in zip(to_parse, parsed):
+                    day_posts[index] = posts
+        else:
+            for index in to_parse:
+                day_posts[index] = parse_daily_file(daily_files[index], cache_paths[index], json_backend)
+
+        # Everything else comes from the cache
+        for index, cache_path in enumerate(cache_paths):
+            if day_posts[index] is None:
+                with open(cache_path, "rb") as file:
+                    day_posts[index] = pickle.load(file)
+
+        posts = [post for posts in day_posts for post in posts]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # Remove cache entries of the prefix that no longer belong to a daily file
+    if use_cache:
+        valid_entries = {os.path.basename(cache_path) for cache_path in cache_paths}
+        for filename in os.listdir(cache_directory):
+            if filename.endswith(".pkl") and filename not in valid_entries:
+                os.remove(os.path.join(cache_directory, filename))
+
+    if verbose:
+        for index in to_parse:
+            print(f"Loading file: {daily_files[index]}")
+        print(f"Loaded {len(posts)} posts from {len(daily_files)} daily file(s), "
+              f"{len(to_parse)} parsed, {len(daily_files) - len(to_parse)} from cache.")
+    return posts
+
+
+# File name friendly version of a flair, e.g. "Politik | Politics" -> "politik_politics"
+def get_flair_slug(flair):
+    if not flair:
+        return "no_flair"
+    return re.sub(r"[^a-z0-9]+", "_", flair.lower()).strip("_") or "flair"
+
+
+# Load the index of the flair-partitioned cleaned data
+def load_cleaned_index(directory=CLEANED_DIRECTORY):
+    index_path = os.path.join(directory, CLEANED_INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f"File not found: {index_path}. Please run '01_SubRedditTextCleaner.py' first.")
+    with open(index_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+# Stream cleaned posts from the flair partitions written by the text cleaner
+# Only the partitions of the given flairs are read (None reads all of them), posts are grouped by flair.
+# A partition consists of one file per day, listed in date order in the index.
+def iter_cleaned_partitions(flairs=None, remove_stopwords=True, directory=CLEANED_DIRECTORY,
+                            json_backend=DEFAULT_JSON_BACKEND):
+    variant = "no_stopwords" if remove_stopwords else "stopwords"
+    for partition in load_cleaned_index(directory)["partitions"]:
+        if flairs is not None and partition["flair"] not in flairs:
+            continue
+        for filename in partition["files"][variant]:
+            yield from iter_posts_from_file(os.path.join(directory, filename), json_backend)
+
+
+# Load cleaned posts from the flair partitions written by the text cleaner
+def load_cleaned_partitions(flairs=None, remove_stopwords=True, directory=CLEANED_DIRECTORY,
+                            json_backend=DEFAULT_JSON_BACKEND):
+    return list(iter_cleaned_partitions(flairs, remove_stopwords, directory, json_backend))
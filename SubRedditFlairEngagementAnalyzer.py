@@ -1,9 +1,11 @@
 import os
-import pickle
 import json
 import csv
 import matplotlib.pyplot as plt
 from collections import defaultdict
+import pyarrow.compute as pc
+from SubRedditCorpusLoader import load_corpus
+from SubRedditColumnarStore import ensure_columnar_store, load_posts_table, load_comments_table
 
 # Define result and data directories
 RESULTS_DIR = "results"
@@ -15,26 +17,9 @@ os.makedirs(RESULTS_JSON_DIR, exist_ok=True)
 os.makedirs(RESULTS_PLOTS_DIR, exist_ok=True)
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# Function to load posts from a pickle file or JSON files
-def load_posts(data_directory=DATA_DIR, pickle_file="data/posts.pkl"):
-    if os.path.exists(pickle_file):
-        print(f"Loading posts from pickle file: {pickle_file}")
-        with open(pickle_file, "rb") as file:
-            return pickle.load(file)
-    else:
-        print("Pickle file not found. Loading posts from JSON files.")
-        posts = []
-        for filename in os.listdir(data_directory):
-            if filename.startswith("austria_posts_with_comments_") and filename.endswith(".json"):
-                filepath = os.path.join(data_directory, filename)
-                print(f"Loading file: {filepath}")
-                with open(filepath, "r", encoding="utf-8") as file:
-                    data = json.load(file)
-                    posts.extend(data)
-        with open(pickle_file, "wb") as file:
-            pickle.dump(posts, file)
-        print(f"Posts saved to pickle file: {pickle_file}")
-        return posts
+# Function to load posts from JSON/NDJSON files (cached per daily file, see SubRedditCorpusLoader)
+def load_posts(data_directory=DATA_DIR):
+    return load_corpus(data_directory, verbose=True)
 
 # Function to save analysis results to a JSON file
 def save_results_to_file(data, filename):
@@ -85,6 +70,59 @@ def analyze_flairs(posts, include_comments=True):
 
     return flair_data
 
+# Function to calculate flair coverage from the columnar posts and comments tables
+def calculate_flair_coverage_from_tables(posts_table, comments_table):
+    total_posts = posts_table.num_rows
+    total_comments = comments_table.num_rows
+
+    # A flair counts if it is neither missing nor empty
+    posts_with_flairs = pc.sum(pc.greater(pc.utf8_length(pc.fill_null(posts_table["flair"], "")), 0)).as_py() or 0
+    comments_with_flairs = pc.sum(pc.greater(pc.utf8_length(pc.fill_null(comments_table["flair"], "")), 0)).as_py() or 0
+
+    print(f"Posts with flairs: {posts_with_flairs} of {total_posts} ({(posts_with_flairs / total_posts) * 100:.2f}%)")
+    print(f"Comments with flairs: {comments_with_flairs} of {total_comments} ({(comments_with_flairs / total_comments) * 100:.2f}%)")
+
+
+# General flair analysis from the columnar posts and comments tables (vectorized group-bys)
+def analyze_flairs_from_tables(posts_table, comments_table, include_comments=True):
+    flair_data = defaultdict(lambda: {"posts": 0, "upvotes": 0, "comments": 0})
+
+    post_groups = posts_table.group_by("flair", use_threads=False).aggregate(
+        [("id", "count"), ("upvotes", "sum"), ("num_comments", "sum")]
+    )
+    for flair, posts, upvotes, comments in zip(post_groups["flair"].to_pylist(), post_groups["id_count"].to_pylist(),
+                                               post_groups["upvotes_sum"].to_pylist(),
+                                               post_groups["num_comments_sum"].to_pylist()):
+        flair_data[flair] = {"posts": posts, "upvotes": upvotes, "comments": comments}
+
+    if include_comments:
+        comment_groups = comments_table.group_by("flair", use_threads=False).aggregate(
+            [("upvotes", "sum"), ("id", "count")]
+        )
+        for flair, upvotes, comments in zip(comment_groups["flair"].to_pylist(),
+                                            comment_groups["upvotes_sum"].to_pylist(),
+                                            comment_groups["id_count"].to_pylist()):
+            flair_data[flair]["upvotes"] += upvotes
+            flair_data[flair]["comments"] += comments
+
+    return flair_data
+
+
+# Flair analysis for specific flairs from the columnar posts and comments tables
+def analyze_specific_flairs_from_tables(posts_table, comments_table, flairs_of_interest, include_comments=True):
+    all_flair_data = analyze_flairs_from_tables(posts_table, comments_table, include_comments)
+    flair_data = {flair: {"posts": 0, "upvotes": 0, "comments": 0} for flair in flairs_of_interest}
+    others = {"posts": 0, "upvotes": 0, "comments": 0}
+
+    for flair, metrics in all_flair_data.items():
+        target = flair_data[flair] if flair in flair_data else others
+        for metric, value in metrics.items():
+            target[metric] += value
+
+    flair_data["Others"] = others
+    return flair_data
+
+
 # Flair analysis for specific flairs
 def analyze_specific_flairs(posts, flairs_of_interest, include_comments=True):
     flair_data = {flair: {"posts": 0, "upvotes": 0, "comments": 0} for flair in flairs_of_interest}
@@ -227,22 +265,24 @@ def visualize_flairs_as_stacked_bar_with_legend(flair_data, metric, flair_colors
 
 if __name__ == "__main__":
 
-    # Load posts
-    posts = load_posts(DATA_DIR)
+    # Load the columnar posts and comments tables, only the columns needed here
+    ensure_columnar_store(DATA_DIR)
+    posts_table = load_posts_table(columns=["id", "flair", "upvotes", "num_comments"])
+    comments_table = load_comments_table(columns=["id", "flair", "upvotes"])
 
     # Calculate coverage of posts and comments with any flair
-    calculate_flair_coverage(posts)
+    calculate_flair_coverage_from_tables(posts_table, comments_table)
 
     # Analyze all flairs (with comments)
     print(f"\nAnalyzing all flairs (including comments)")
-    all_flairs_with_comments = analyze_flairs(posts, include_comments=True)
+    all_flairs_with_comments = analyze_flairs_from_tables(posts_table, comments_table, include_comments=True)
     save_results_to_file(all_flairs_with_comments, "all_flairs_with_comments.json")
     save_results_to_csv(all_flairs_with_comments, "all_flairs_with_comments.csv")
     visualize_flair_data(all_flairs_with_comments, "All Flairs (Including Comments)", "all_flairs_with_comments")
 
     # Analyze all flairs (without comments)
     print(f"Analyzing all flairs (only posts, without comments)")
-    all_flairs_without_comments = analyze_flairs(posts, include_comments=False)
+    all_flairs_without_comments = analyze_flairs_from_tables(posts_table, comments_table, include_comments=False)
     save_results_to_file(all_flairs_without_comments, "all_flairs_without_comments.json")
     save_results_to_csv(all_flairs_without_comments, "all_flairs_without_comments.csv")
     visualize_flair_data(all_flairs_without_comments, "All Flairs (Excluding Comments)", "all_flairs_without_comments")
@@ -272,10 +312,10 @@ if __name__ == "__main__":
     print("Feel free to modify the 'flairs_of_interest' list to match your subreddit.")
 
     # Analyze specific flairs (with comments)
-    specific_flair_data_with_comments = analyze_specific_flairs(posts, flairs_of_interest, include_comments=True)
+    specific_flair_data_with_comments = analyze_specific_flairs_from_tables(posts_table, comments_table, flairs_of_interest, include_comments=True)
     save_results_to_file(specific_flair_data_with_comments, "specific_flair_analysis_with_comments.json")
     save_results_to_csv(specific_flair_data_with_comments, "specific_flair_analysis_with_comments.csv")
-    specific_flair_data_with_comments = analyze_specific_flairs(posts, flairs_of_interest, include_comments=True)
+    specific_flair_data_with_comments = analyze_specific_flairs_from_tables(posts_table, comments_table, flairs_of_interest, include_comments=True)
     save_results_to_file(specific_flair_data_with_comments, "specific_flair_analysis_with_comments.json")
     save_results_to_csv(specific_flair_data_with_comments, "specific_flair_analysis_with_comments.csv")
     visualize_flairs_as_pie(
@@ -319,7 +359,7 @@ if __name__ == "__main__":
 
 
     # Analyze specific flairs (without comments)
-    specific_flair_data_without_comments = analyze_specific_flairs(posts, flairs_of_interest, include_comments=False)
+    specific_flair_data_without_comments = analyze_specific_flairs_from_tables(posts_table, comments_table, flairs_of_interest, include_comments=False)
     save_results_to_file(specific_flair_data_without_comments, "specific_flair_analysis_without_comments.json")
     save_results_to_csv(specific_flair_data_without_comments, "specific_flair_analysis_without_comments.csv")
     visualize_flairs_as_pie(
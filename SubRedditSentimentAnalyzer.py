@@ -1,7 +1,17 @@
 import os
+import sys
+import copy
 import json
-from transformers import pipeline
-import matplotlib.pyplot as plt
+import time
+import queue
+import sqlite3
+import threading
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from SubRedditCorpusLoader import load_cleaned_partitions, iter_cleaned_partitions, CACHE_DIRECTORY_NAME
+
+# transformers, PyTorch, ONNX Runtime, NumPy and matplotlib are imported where they are used, so runs that only
+# plot or only hit the sentiment cache don't pay for importing them
 
 # Define directories
 input_dir = "data"
@@ -16,10 +26,209 @@ def load_processed_data(filename):
     with open(filepath, "r", encoding="utf-8") as file:
         return json.load(file)
 
+# Sentiment model and inference settings
+SENTIMENT_MODEL = "nlptown/bert-base-multilingual-uncased-sentiment"
+SENTIMENT_MODEL_REVISION = "main"  # Branch, tag or commit hash, resolved to its commit hash by resolve_model_revision
+MAX_TOKENS = 512  # Maximum input length of the model
+DEFAULT_BATCH_SIZE = 32
+SENTIMENT_LABELS = ["1 star", "2 stars", "3 stars", "4 stars", "5 stars"]  # Order of the score vectors
+WINDOW_STRIDE = 128  # Overlapping tokens of neighboring windows when long texts are chunked
+TEXTS_PER_WINDOW_GROUP = 8  # With chunking, windows of up to batch_size * 8 texts are sorted and batched together
+
+# Inference backends: PyTorch (transformers pipeline) or ONNX Runtime, optionally with dynamic int8 quantization
+SENTIMENT_BACKENDS = ("pytorch", "onnx", "onnx-int8")
+ONNX_DIRECTORY = os.path.join(input_dir, CACHE_DIRECTORY_NAME, "onnx")
+
+# Commit hashes of resolved model revisions, so the Hub is asked at most once per process
+_resolved_revisions = {}
+_resolved_revisions_lock = threading.Lock()
+
+# Check if a revision is a full commit hash
+def is_commit_hash(revision):
+    return len(revision) == 40 and all(character in "0123456789abcdef" for character in revision)
+
+# Resolve a revision of the sentiment model (branch, tag or commit hash) to its commit hash
+# Only called when the model is loaded: the model is loaded with the commit hash, and SentimentCache stores it
+# for the revision, so runs that only hit the cache never ask the Hub. Without access to the Hub (offline or
+# HF_HUB_OFFLINE), the commit of the locally downloaded snapshot is used, which is also the one transformers loads.
+def resolve_model_revision(revision=SENTIMENT_MODEL_REVISION):
+    if is_commit_hash(revision):
+        return revision
+
+    with _resolved_revisions_lock:
+        if revision not in _resolved_revisions:
+            import huggingface_hub
+
+            try:
+                sha = huggingface_hub.HfApi().model_info(SENTIMENT_MODEL, revision=revision).sha
+            except Exception as error:
+                try:
+                    snapshot_path = huggingface_hub.snapshot_download(SENTIMENT_MODEL, revision=revision,
+                                                                      local_files_only=True)
+                except Exception:
+                    raise RuntimeError(f"Could not resolve revision '{revision}' of {SENTIMENT_MODEL} ({error}) and "
+                                       f"no local snapshot exists, set SENTIMENT_MODEL_REVISION to a commit hash.")
+                sha = os.path.basename(snapshot_path)
+            _resolved_revisions[revision] = sha
+        return _resolved_revisions[revision]
+
+# Directory of the exported ONNX model, tokenizer and config
+def get_onnx_model_directory(directory=ONNX_DIRECTORY):
+    return os.path.join(directory, SENTIMENT_MODEL.replace("/", "--"), resolve_model_revision())
+
+# Export the model to ONNX once (optionally quantized to int8) and return the path of the model file
+# Only the export needs PyTorch, running the exported model needs ONNX Runtime and the tokenizer.
+def export_onnx_model(quantize=False, directory=ONNX_DIRECTORY):
+    model_directory = get_onnx_model_directory(directory)
+    onnx_path = os.path.join(model_directory, "model.onnx")
+    quantized_path = os.path.join(model_directory, "model_int8.onnx")
+
+    if not os.path.exists(onnx_path):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+        print(f"Exporting {SENTIMENT_MODEL} to ONNX...")
+        os.makedirs(model_directory, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(SENTIMENT_MODEL, revision=resolve_model_revision())
+        model = AutoModelForSequenceClassification.from_pretrained(SENTIMENT_MODEL, revision=resolve_model_revision())
+        model.eval()
+        inputs = tokenizer(["Export des Modells"], return_tensors="pt")
+        input_names = ["input_ids", "attention_mask", "token_type_ids"]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["logits"] = {0: "batch"}
+        with torch.no_grad():
+            torch.onnx.export(model, tuple(inputs[name] for name in input_names), onnx_path + ".tmp",
+                              input_names=input_names, output_names=["logits"], dynamic_axes=dynamic_axes,
+                              opset_version=17)
+        tokenizer.save_pretrained(model_directory)
+        model.config.save_pretrained(model_directory)
+        os.replace(onnx_path + ".tmp", onnx_path)  # Written last, a missing file means the export has to run again
+
+    if not quantize:
+        return onnx_path
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        print("Quantizing ONNX model to int8...")
+        quantize_dynamic(onnx_path, quantized_path + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(quantized_path + ".tmp", quantized_path)
+    return quantized_path
+
+# Turn the logits of a batch into results like the pipeline's (softmax over the classes, best label and its score)
+def logits_to_results(logits, id2label):
+    import numpy as np
+
+    probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    label_order = [[id2label[label_id] for label_id in range(len(id2label))].index(label) for label in SENTIMENT_LABELS]
+    results = []
+    for scores in probabilities:
+        label_id = int(scores.argmax())
+        results.append({"label": id2label[label_id], "score": float(scores[label_id]),
+                        "scores": scores[label_order].astype(np.float16)})
+    return results
+
+# Result of a text from the pipeline's output with top_k=None (all classes): label, score and the score vector
+def to_sentiment_result(output):
+    import numpy as np
+
+    if isinstance(output, dict):
+        return output  # Already a result, from the ONNX pipeline
+    if output and isinstance(output[0], list):
+        output = output[0]  # Single texts are wrapped in another list by some transformers versions
+    scores = {entry["label"]: entry["score"] for entry in output}
+    best = max(output, key=lambda entry: entry["score"])
+    return {"label": best["label"], "score": best["score"],
+            "scores": np.array([scores[label] for label in SENTIMENT_LABELS], dtype=np.float16)}
+
+# Sentiment pipeline on ONNX Runtime, called like the transformers pipeline and returning the same labels
+class OnnxSentimentPipeline:
+    def __init__(self, quantize=False, num_threads=None, directory=ONNX_DIRECTORY):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The ONNX backends need onnxruntime, install it with 'pip install onnxruntime'.")
+        from transformers import AutoTokenizer, AutoConfig
+
+        model_path = export_onnx_model(quantize, directory)
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+        model_directory = get_onnx_model_directory(directory)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_directory)
+        self.id2label = AutoConfig.from_pretrained(model_directory).id2label
+
+    # Tokenize a batch of texts
+    def encode(self, texts, truncation=True, max_length=MAX_TOKENS):
+        return self.tokenizer(texts, padding=True, truncation=truncation, max_length=max_length, return_tensors="np")
+
+    # Run the model on a tokenized batch
+    def predict(self, encoded):
+        import numpy as np
+
+        logits = self.session.run(None, {name: encoded[name].astype(np.int64) for name in self.input_names})[0]
+        return logits_to_results(logits, self.id2label)
+
+    # Results always include the score vector, top_k is only accepted for compatibility with the pipeline
+    def __call__(self, texts, batch_size=DEFAULT_BATCH_SIZE, truncation=True, max_length=MAX_TOKENS, top_k=None):
+        if isinstance(texts, str):
+            texts = [texts]
+
+        results = []
+        for start in range(0, len(texts), batch_size):
+            results.extend(self.predict(self.encode(texts[start:start + batch_size], truncation, max_length)))
+        return results
+
+# Load the sentiment analysis model for a backend (num_threads only applies to the ONNX backends)
+def load_sentiment_pipeline(backend="pytorch", num_threads=None):
+    if backend == "pytorch":
+        from transformers import pipeline
+        return pipeline("sentiment-analysis", model=SENTIMENT_MODEL, revision=resolve_model_revision())
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxSentimentPipeline(quantize=backend == "onnx-int8", num_threads=num_threads)
+    raise ValueError(f"Invalid backend specified. Use one of {', '.join(SENTIMENT_BACKENDS)}.")
+
+# Tokenize a batch for the model of a sentiment pipeline, separate from predict_batch so both can run in parallel
+# Fast tokenizers are not thread-safe, a thread that tokenizes next to the pipeline passes its own copy.
+def encode_batch(sentiment_pipeline, texts, tokenizer=None):
+    tokenizer = tokenizer or sentiment_pipeline.tokenizer
+    tensor_type = "np" if isinstance(sentiment_pipeline, OnnxSentimentPipeline) else "pt"
+    return tokenizer(texts, padding=True, truncation=True, max_length=MAX_TOKENS, return_tensors=tensor_type)
+
+# Run the model of a sentiment pipeline on a batch from encode_batch, same results as calling the pipeline
+def predict_batch(sentiment_pipeline, encoded):
+    if isinstance(sentiment_pipeline, OnnxSentimentPipeline):
+        return sentiment_pipeline.predict(encoded)
+
+    import torch
+    model = sentiment_pipeline.model
+    with torch.no_grad():
+        logits = model(**encoded.to(model.device)).logits.float().cpu().numpy()
+    return logits_to_results(logits, model.config.id2label)
+
+# Loaded sentiment pipelines by (backend, num_threads), so every model is loaded at most once per process
+_sentiment_pipelines = {}
+_sentiment_pipelines_lock = threading.Lock()
+
+# Get the sentiment pipeline of a backend, it is loaded on first use
+def get_sentiment_pipeline(backend="pytorch", num_threads=None):
+    with _sentiment_pipelines_lock:
+        if (backend, num_threads) not in _sentiment_pipelines:
+            _sentiment_pipelines[(backend, num_threads)] = load_sentiment_pipeline(backend, num_threads)
+        return _sentiment_pipelines[(backend, num_threads)]
+
+# Model name in the sentiment cache, results of the backends and of chunked scoring are cached separately
+def get_sentiment_cache_model(backend="pytorch", chunk_long_texts=False):
+    model = SENTIMENT_MODEL if backend == "pytorch" else f"{SENTIMENT_MODEL}:{backend}"
+    return f"{model}:chunked" if chunk_long_texts else model
+
 # Perform sentiment analysis
 def perform_sentiment_analysis(data):
     # Load the sentiment analysis model
-    sentiment_pipeline = pipeline("sentiment-analysis", model="nlptown/bert-base-multilingual-uncased-sentiment")
+    sentiment_pipeline = get_sentiment_pipeline()
 
     analyzed_data = []
     for item in data:
@@ -52,6 +261,548 @@ def perform_sentiment_analysis(data):
 
     return analyzed_data
 
+# Collect the texts to analyze, as (item, text) pairs of posts (title + selftext) and comments
+def collect_sentiment_texts(data):
+    targets = []
+    for item in data:
+        title = item.get("cleaned_title", "").strip()
+        selftext = item.get("cleaned_selftext", "").strip()
+        combined_text = f"{title} {selftext}".strip()
+        if combined_text:  # Skip empty posts
+            targets.append((item, combined_text))
+
+        for comment in item.get("comments", []):
+            cleaned_body = comment.get("cleaned_body", "").strip()
+            if cleaned_body:  # Skip empty comments
+                targets.append((comment, cleaned_body))
+    return targets
+
+# Hash of a text after normalizing its whitespace (the tokenizer ignores whitespace differences)
+def get_text_hash(text):
+    return hashlib.blake2b(" ".join(text.split()).encode("utf-8"), digest_size=16).hexdigest()
+
+# Persistent cache of sentiment results in SQLite, keyed by (model, commit hash of the model revision, text hash)
+# A branch or tag as revision is looked up in the model_revisions table, which holds the commit hash it was
+# resolved to when the model was last loaded. Until the model has been loaded once, nothing counts as cached.
+# Results of a run that loads the model are stored under the freshly resolved commit hash (see put_many).
+class SentimentCache:
+    def __init__(self, path=os.path.join(input_dir, CACHE_DIRECTORY_NAME, "sentiment_cache.sqlite"),
+                 model=SENTIMENT_MODEL, revision=SENTIMENT_MODEL_REVISION):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.model = model
+        self.requested_revision = revision
+        self.revision_resolved = is_commit_hash(revision)  # Resolved in this run
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()  # The streaming mode reads and writes from different threads
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment (
+                model TEXT NOT NULL,
+                revision TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                label TEXT NOT NULL,
+                score REAL NOT NULL,
+                scores BLOB,
+                PRIMARY KEY (model, revision, text_hash)
+            ) WITHOUT ROWID""")
+        # Caches from before the score vectors get the column, their rows count as missing until scored again
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(sentiment)")]
+        if "scores" not in columns:
+            self.connection.execute("ALTER TABLE sentiment ADD COLUMN scores BLOB")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS model_revisions (
+                model TEXT NOT NULL,
+                revision TEXT NOT NULL,
+                commit_hash TEXT NOT NULL,
+                PRIMARY KEY (model, revision)
+            )""")
+        self.connection.commit()
+
+        # Commit hash the results are keyed with, None while the revision was never resolved
+        self.revision = revision if self.revision_resolved else None
+        if self.revision is None:
+            row = self.connection.execute("SELECT commit_hash FROM model_revisions WHERE model = ? AND revision = ?",
+                                          [SENTIMENT_MODEL, revision]).fetchone()
+            self.revision = row[0] if row else None
+
+    # Key the results with a commit hash of the revision from now on and store it for later runs
+    def set_revision(self, commit_hash):
+        with self.lock:
+            self.revision = commit_hash
+            self.revision_resolved = True
+            self.connection.execute(
+                "INSERT OR REPLACE INTO model_revisions (model, revision, commit_hash) VALUES (?, ?, ?)",
+                [SENTIMENT_MODEL, self.requested_revision, commit_hash])
+            self.connection.commit()
+
+    # Look up text hashes, returns {text hash: (label, score, scores)} of the cached ones
+    def get_many(self, text_hashes, chunk_size=500):
+        import numpy as np
+
+        text_hashes = list(text_hashes)
+        results = {}
+        if self.revision is None:
+            return results  # No results of any commit of the revision yet
+        for start in range(0, len(text_hashes), chunk_size):
+            chunk = text_hashes[start:start + chunk_size]
+            with self.lock:
+                rows = self.connection.execute(
+                    f"SELECT text_hash, label, score, scores FROM sentiment WHERE model = ? AND revision = ? "
+                    f"AND scores IS NOT NULL AND text_hash IN ({', '.join('?' * len(chunk))})",
+                    [self.model, self.revision, *chunk]).fetchall()
+            results.update((text_hash, (label, score, np.frombuffer(scores, dtype=np.float16)))
+                           for text_hash, label, score, scores in rows)
+        return results
+
+    # Store results given as (text hash, label, score, float16 scores) and commit, so finished batches survive a crash
+    # Results come from a loaded model, so the revision is resolved (once per run) to the commit hash it was loaded with.
+    def put_many(self, results):
+        if not self.revision_resolved:
+            self.set_revision(resolve_model_revision(self.requested_revision))
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO sentiment (model, revision, text_hash, label, score, scores) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.model, self.revision, text_hash, label, score, scores.tobytes())
+                 for text_hash, label, score, scores in results])
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+# Split texts into overlapping windows of at most MAX_TOKENS tokens and pad them into batches
+# All windows (of short and long texts alike) are sorted by length before batching, so a long text adds full
+# batches of equally long windows instead of padding the short texts. Returns a list of
+# (text index of every window, token count of every window, encoded batch).
+def encode_windows(sentiment_pipeline, texts, batch_size=DEFAULT_BATCH_SIZE, stride=WINDOW_STRIDE, tokenizer=None):
+    tokenizer = tokenizer or sentiment_pipeline.tokenizer
+    encoded = tokenizer(texts, truncation=True, max_length=MAX_TOKENS, stride=stride, return_overflowing_tokens=True)
+    text_indices = encoded["overflow_to_sample_mapping"]
+    features = [name for name in encoded.keys() if name != "overflow_to_sample_mapping"]
+    tensor_type = "np" if isinstance(sentiment_pipeline, OnnxSentimentPipeline) else "pt"
+
+    windows = sorted(range(len(text_indices)), key=lambda window: len(encoded["input_ids"][window]), reverse=True)
+    window_batches = []
+    for start in range(0, len(windows), batch_size):
+        batch = windows[start:start + batch_size]
+        padded = tokenizer.pad({name: [encoded[name][window] for window in batch] for name in features},
+                               return_tensors=tensor_type)
+        window_batches.append(([text_indices[window] for window in batch],
+                               [len(encoded["input_ids"][window]) for window in batch], padded))
+    return window_batches
+
+# Score the window batches of encode_windows and combine them into one result per text
+# The class probabilities of the windows of a text are averaged, weighted by their number of tokens.
+# Texts that fit into one window keep the result of that window, the same as without chunking.
+def score_windows(sentiment_pipeline, window_batches, num_texts):
+    import numpy as np
+
+    window_results = [[] for _ in range(num_texts)]
+    for text_indices, token_counts, encoded in window_batches:
+        for text_index, token_count, result in zip(text_indices, token_counts,
+                                                   predict_batch(sentiment_pipeline, encoded)):
+            window_results[text_index].append((token_count, result))
+
+    results = []
+    for windows in window_results:
+        if len(windows) == 1:
+            results.append(windows[0][1])
+            continue
+        weights = np.array([token_count for token_count, _ in windows], dtype=np.float32)
+        scores = np.stack([result["scores"].astype(np.float32) for _, result in windows])
+        combined = weights @ scores / weights.sum()
+        label_id = int(combined.argmax())
+        results.append({"label": SENTIMENT_LABELS[label_id], "score": float(combined[label_id]),
+                        "scores": combined.astype(np.float16), "windows": len(windows)})
+    return results
+
+# Score texts truncated to MAX_TOKENS tokens or, with chunk_long_texts, chunked into overlapping windows
+def score_texts(sentiment_pipeline, texts, batch_size=DEFAULT_BATCH_SIZE, chunk_long_texts=False):
+    if chunk_long_texts:
+        return score_windows(sentiment_pipeline, encode_windows(sentiment_pipeline, texts, batch_size), len(texts))
+    outputs = sentiment_pipeline(texts, batch_size=batch_size, truncation=True, max_length=MAX_TOKENS, top_k=None)
+    return [to_sentiment_result(output) for output in outputs]
+
+# Score a batch of texts, a failing batch is retried text by text so only the broken texts get an error label
+def score_batch(sentiment_pipeline, texts, batch_size=DEFAULT_BATCH_SIZE, chunk_long_texts=False):
+    try:
+        return score_texts(sentiment_pipeline, texts, batch_size, chunk_long_texts)
+    except Exception as e:
+        print(f"Error processing batch, retrying texts one by one: {e}")
+        results = []
+        for text in texts:
+            try:
+                results.extend(score_texts(sentiment_pipeline, [text], batch_size, chunk_long_texts))
+            except Exception as text_error:
+                results.append({"label": "error", "error": str(text_error)})
+        return results
+
+# Sentiment pipeline of a worker process, loaded once by init_sentiment_worker
+_worker_pipeline = None
+
+# Set up a worker process of the sharded sentiment analysis
+def init_sentiment_worker(backend, num_threads):
+    global _worker_pipeline
+    if backend == "pytorch" and num_threads:
+        import torch
+        torch.set_num_threads(num_threads)
+    _worker_pipeline = get_sentiment_pipeline(backend, num_threads)
+
+# Number of texts scored together, with chunking the windows of several batches of texts are batched together
+def get_texts_per_step(batch_size, chunk_long_texts):
+    return batch_size * TEXTS_PER_WINDOW_GROUP if chunk_long_texts else batch_size
+
+# Score a shard of texts in a worker process, returns (process id, results, seconds)
+def score_shard(texts, batch_size=DEFAULT_BATCH_SIZE, chunk_long_texts=False):
+    start_time = time.perf_counter()
+    results = []
+    step = get_texts_per_step(batch_size, chunk_long_texts)
+    for start in range(0, len(texts), step):
+        results.extend(score_batch(_worker_pipeline, texts[start:start + step], batch_size, chunk_long_texts))
+    return os.getpid(), results, time.perf_counter() - start_time
+
+# Score (text hash, text) entries and yield them as (entries, results), in the order of the entries
+# With workers > 1, shards of shard_size texts are scored in a pool of worker processes, each with its own model
+# and num_threads threads (default: the CPUs divided by the workers). Throughput per worker is printed at the end.
+def iter_scored_batches(entries, batch_size=DEFAULT_BATCH_SIZE, sentiment_pipeline=None, backend="pytorch",
+                        num_threads=None, workers=1, shard_size=None, chunk_long_texts=False):
+    if workers <= 1:
+        sentiment_pipeline = sentiment_pipeline or get_sentiment_pipeline(backend, num_threads)
+        step = get_texts_per_step(batch_size, chunk_long_texts)
+        for start in range(0, len(entries), step):
+            batch = entries[start:start + step]
+            yield batch, score_batch(sentiment_pipeline, [text for _, text in batch], batch_size, chunk_long_texts)
+        return
+
+    num_threads = num_threads or max(1, (os.cpu_count() or 1) // workers)
+    shard_size = shard_size or batch_size * 8
+    shards = [entries[start:start + shard_size] for start in range(0, len(entries), shard_size)]
+    worker_stats = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_sentiment_worker,
+                             initargs=(backend, num_threads)) as executor:
+        scored_shards = executor.map(score_shard, [[text for _, text in shard] for shard in shards],
+                                     [batch_size] * len(shards), [chunk_long_texts] * len(shards))
+        for shard, (process_id, results, elapsed) in zip(shards, scored_shards):  # map keeps the order of the shards
+            num_texts, busy_seconds = worker_stats.get(process_id, (0, 0.0))
+            worker_stats[process_id] = (num_texts + len(shard), busy_seconds + elapsed)
+            yield shard, results
+
+    print(f"Workers: {workers}, threads per worker: {num_threads}")
+    for worker, (process_id, (num_texts, busy_seconds)) in enumerate(sorted(worker_stats.items()), start=1):
+        print(f"  Worker {worker} (pid {process_id}): {num_texts} texts in {busy_seconds:.1f} s, "
+              f"{num_texts / busy_seconds:.1f} texts/s")
+
+# Perform sentiment analysis in batches, same labels as perform_sentiment_analysis without its character limit
+# Identical texts are scored only once and, with a SentimentCache, texts scored in earlier runs are not scored
+# again (the model is only loaded if something is left to score). The remaining texts are sorted by length so
+# every batch holds texts of similar length and little padding is needed, long texts are truncated by the
+# tokenizer to MAX_TOKENS tokens, or with chunk_long_texts scored in overlapping windows (see encode_windows).
+# See iter_scored_batches for workers > 1.
+def perform_sentiment_analysis_batched(data, batch_size=DEFAULT_BATCH_SIZE, sentiment_pipeline=None, cache=None,
+                                       backend="pytorch", num_threads=None, workers=1, text_scores=None,
+                                       chunk_long_texts=False):
+    # Group the targets by text, duplicates within the run are scored once
+    texts = {}
+    for target, text in collect_sentiment_texts(data):
+        text_hash = get_text_hash(text)
+        if text_hash not in texts:
+            texts[text_hash] = (text, [])
+        texts[text_hash][1].append(target)
+
+    num_targets = sum(len(targets) for _, targets in texts.values())
+    cached = cache.get_many(texts) if cache is not None else {}
+    for text_hash, (label, _, scores) in cached.items():
+        for target in texts[text_hash][1]:
+            target["sentiment"] = label
+        if text_scores is not None:
+            text_scores[text_hash] = scores
+
+    to_score = [(text_hash, text) for text_hash, (text, _) in texts.items() if text_hash not in cached]
+    to_score.sort(key=lambda entry: len(entry[1]), reverse=True)
+    print(f"Texts: {num_targets}, unique: {len(texts)}, cached: {len(cached)}, to score: {len(to_score)}")
+    if not to_score:
+        return data
+
+    for batch, results in iter_scored_batches(to_score, batch_size, sentiment_pipeline, backend, num_threads, workers,
+                                              chunk_long_texts=chunk_long_texts):
+        for (text_hash, _), result in zip(batch, results):
+            if result["label"] == "error":
+                ids = [target.get("id", "unknown") for target in texts[text_hash][1]]
+                print(f"Error processing ID(s) {', '.join(ids)}: {result.get('error')}")
+            for target in texts[text_hash][1]:
+                target["sentiment"] = result["label"]
+            if text_scores is not None and "scores" in result:
+                text_scores[text_hash] = result["scores"]
+
+        # Errors are not cached, they are retried in the next run
+        if cache is not None:
+            cache.put_many([(text_hash, result["label"], result["score"], result["scores"])
+                            for (text_hash, _), result in zip(batch, results) if result["label"] != "error"])
+
+    return data
+
+# Count the sentiment labels of a post and its comments (posts and comments without a label count as "unknown")
+def add_sentiment_counts(sentiment_counts, item):
+    sentiment = item.get("sentiment", "unknown")
+    sentiment_counts[sentiment] = sentiment_counts.get(sentiment, 0) + 1
+    for comment in item.get("comments", []):
+        comment_sentiment = comment.get("sentiment", "unknown")
+        sentiment_counts[comment_sentiment] = sentiment_counts.get(comment_sentiment, 0) + 1
+
+# Score vectors of the analyzed texts with their ids, flair and UTC day, stored compactly as NumPy arrays
+# The float16 scores hold the probabilities of SENTIMENT_LABELS, 10 bytes per text.
+class SentimentScoreTable:
+    def __init__(self):
+        self.ids = []
+        self.post_ids = []
+        self.is_comment = []
+        self.flairs = []
+        self.created_utc = []
+        self.scores = []
+
+    # Add a post and its comments, text_scores maps text hashes to score vectors (texts without one are skipped)
+    def add_post(self, item, text_scores):
+        for target, text in collect_sentiment_texts([item]):
+            scores = text_scores.get(get_text_hash(text))
+            if scores is None:
+                continue
+            self.ids.append(target.get("id", ""))
+            self.post_ids.append(item.get("id", ""))
+            self.is_comment.append(target is not item)
+            self.flairs.append(item.get("flair") or "")
+            self.created_utc.append(target.get("created_utc", item.get("created_utc", 0)))
+            self.scores.append(scores)
+
+    # The table as NumPy arrays, one row per text
+    def to_arrays(self):
+        import numpy as np
+
+        return {
+            "id": np.array(self.ids, dtype=str),
+            "post_id": np.array(self.post_ids, dtype=str),
+            "is_comment": np.array(self.is_comment, dtype=bool),
+            "flair": np.array(self.flairs, dtype=str),
+            "day": (np.array(self.created_utc, dtype=np.int64) // 86400).astype("datetime64[D]"),
+            "scores": np.array(self.scores, dtype=np.float16).reshape(-1, len(SENTIMENT_LABELS)),
+        }
+
+    def save(self, path):
+        import numpy as np
+
+        np.savez_compressed(path, **self.to_arrays())
+        print(f"Saved {len(self.scores)} sentiment score vectors to {path}")
+
+# Load a table saved by SentimentScoreTable.save as a dict of NumPy arrays
+def load_sentiment_score_table(path=os.path.join(output_dir, "sentiment_scores.npz")):
+    import numpy as np
+
+    with np.load(path) as table:
+        return {name: table[name] for name in table.files}
+
+# Aggregate sentiment per group with vectorized NumPy operations, e.g. aggregate_sentiment(table, ("day", "flair"))
+# Returns per column of the table: the groups, number of texts, mean sentiment in stars (probability-weighted),
+# mean probability per class and histogram of the predicted classes (columns in the order of SENTIMENT_LABELS).
+def aggregate_sentiment(table, by=("day", "flair", "post_id")):
+    import numpy as np
+
+    scores = table["scores"].astype(np.float32)
+    predicted = scores.argmax(axis=1)
+    num_classes = scores.shape[1]
+    stars = np.arange(1, num_classes + 1, dtype=np.float32)
+
+    aggregates = {}
+    for column in by:
+        groups, inverse = np.unique(table[column], return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(groups))
+        sums = np.stack([np.bincount(inverse, weights=scores[:, label], minlength=len(groups))
+                         for label in range(num_classes)], axis=1)
+        mean_probabilities = sums / np.maximum(counts, 1)[:, None]
+        aggregates[column] = {
+            "groups": groups,
+            "count": counts,
+            "mean_stars": mean_probabilities @ stars,
+            "mean_probabilities": mean_probabilities,
+            "histogram": np.bincount(inverse * num_classes + predicted,
+                                     minlength=len(groups) * num_classes).reshape(len(groups), num_classes),
+        }
+    return aggregates
+
+# Marks the end of the items in a queue of the streaming mode
+_END_OF_STREAM = object()
+
+# Streaming sentiment analysis: read -> batch -> infer -> write NDJSON, returns the sentiment counts
+# A reader thread groups the posts into chunks of about chunk_size texts, takes cached and duplicate texts aside
+# and tokenizes the rest in length-sorted batches, while the main thread runs the model on the previous chunk.
+# A writer thread writes the finished posts to output_path (one post per line) and counts the labels on the fly.
+# The bounded queues between the stages hold at most queue_size chunks, so memory doesn't grow with the corpus.
+# With a SentimentScoreTable, the score vectors of the written posts are added to it.
+# The reader tokenizes with its own copy of the tokenizer, the main thread keeps the pipeline's for score_batch.
+# If a stage fails, the stop event ends the reader (it never blocks on a full queue) and the error is raised.
+def stream_sentiment_analysis(posts, output_path, batch_size=DEFAULT_BATCH_SIZE, sentiment_pipeline=None, cache=None,
+                              backend="pytorch", num_threads=None, chunk_size=None, queue_size=4, score_table=None,
+                              chunk_long_texts=False):
+    chunk_size = chunk_size or batch_size * 8
+    encoded_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    sentiment_counts = {}
+    writer_errors = []
+    stop_event = threading.Event()
+    reader_tokenizers = []
+
+    # The model is only loaded once a text isn't in the cache
+    def get_pipeline():
+        return sentiment_pipeline or get_sentiment_pipeline(backend, num_threads)
+
+    # Tokenizer of the reader thread, copied from the pipeline's on first use
+    def get_reader_tokenizer():
+        if not reader_tokenizers:
+            reader_tokenizers.append(copy.deepcopy(get_pipeline().tokenizer))
+        return reader_tokenizers[0]
+
+    # Put an item into a queue unless the stream is stopped, returns False if it was
+    def put_unless_stopped(target_queue, item):
+        while not stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # Group the texts of a chunk, label cached texts and tokenize the rest
+    def prepare_chunk(chunk_posts):
+        texts = {}
+        for target, text in collect_sentiment_texts(chunk_posts):
+            text_hash = get_text_hash(text)
+            if text_hash not in texts:
+                texts[text_hash] = (text, [])
+            texts[text_hash][1].append(target)
+
+        cached = cache.get_many(texts) if cache is not None else {}
+        text_scores = {}
+        for text_hash, (label, _, scores) in cached.items():
+            for target in texts[text_hash][1]:
+                target["sentiment"] = label
+            text_scores[text_hash] = scores
+
+        to_score = [(text_hash, text) for text_hash, (text, _) in texts.items() if text_hash not in cached]
+        to_score.sort(key=lambda entry: len(entry[1]), reverse=True)
+        batches = []
+        step = len(to_score) if chunk_long_texts else batch_size  # Windows of the whole chunk are batched together
+        for start in range(0, len(to_score), max(step, 1)):
+            batch = to_score[start:start + step]
+            try:
+                if chunk_long_texts:
+                    encoded = encode_windows(get_pipeline(), [text for _, text in batch], batch_size,
+                                             tokenizer=get_reader_tokenizer())
+                else:
+                    encoded = encode_batch(get_pipeline(), [text for _, text in batch], get_reader_tokenizer())
+            except Exception:
+                encoded = None  # Scored through the pipeline's error handling in the main thread
+            batches.append((batch, encoded))
+        return chunk_posts, texts, text_scores, batches
+
+    # Stage 1: read and batch (reader thread)
+    def read_posts():
+        try:
+            chunk_posts = []
+            chunk_texts = 0
+            for post in posts:
+                if stop_event.is_set():
+                    return
+                chunk_posts.append(post)
+                chunk_texts += 1 + len(post.get("comments", []))
+                if chunk_texts >= chunk_size:
+                    if not put_unless_stopped(encoded_queue, prepare_chunk(chunk_posts)):
+                        return
+                    chunk_posts = []
+                    chunk_texts = 0
+            if chunk_posts and not put_unless_stopped(encoded_queue, prepare_chunk(chunk_posts)):
+                return
+        except Exception as error:
+            if not put_unless_stopped(encoded_queue, error):
+                return
+        put_unless_stopped(encoded_queue, _END_OF_STREAM)
+
+    # Stage 3: write and count (writer thread)
+    def write_posts():
+        try:
+            with open(output_path + ".part", "w", encoding="utf-8") as file:
+                while True:
+                    chunk = write_queue.get()
+                    if chunk is _END_OF_STREAM:
+                        break
+                    chunk_posts, text_scores = chunk
+                    for item in chunk_posts:
+                        file.write(json.dumps(item, ensure_ascii=False) + "\n")
+                        add_sentiment_counts(sentiment_counts, item)
+                        if score_table is not None:
+                            score_table.add_post(item, text_scores)
+                file.flush()
+                os.fsync(file.fileno())
+        except Exception as error:
+            writer_errors.append(error)
+            while write_queue.get() is not _END_OF_STREAM:
+                pass  # Keep draining, so the main thread never blocks on a full queue
+
+    reader = threading.Thread(target=read_posts, daemon=True)
+    writer = threading.Thread(target=write_posts, daemon=True)
+    reader.start()
+    writer.start()
+
+    # Stage 2: infer (main thread)
+    try:
+        while True:
+            item = encoded_queue.get()
+            if item is _END_OF_STREAM:
+                break
+            if isinstance(item, Exception):
+                raise item
+            chunk_posts, texts, text_scores, batches = item
+
+            for batch, encoded in batches:
+                try:
+                    if encoded is None:
+                        raise ValueError("tokenization failed")
+                    if chunk_long_texts:
+                        results = score_windows(get_pipeline(), encoded, len(batch))
+                    else:
+                        results = predict_batch(get_pipeline(), encoded)
+                except Exception:
+                    results = score_batch(get_pipeline(), [text for _, text in batch], batch_size, chunk_long_texts)
+
+                for (text_hash, _), result in zip(batch, results):
+                    if result["label"] == "error":
+                        ids = [target.get("id", "unknown") for target in texts[text_hash][1]]
+                        print(f"Error processing ID(s) {', '.join(ids)}: {result.get('error')}")
+                    for target in texts[text_hash][1]:
+                        target["sentiment"] = result["label"]
+                    if "scores" in result:
+                        text_scores[text_hash] = result["scores"]
+
+                # Errors are not cached, they are retried in the next run
+                if cache is not None:
+                    cache.put_many([(text_hash, result["label"], result["score"], result["scores"])
+                                    for (text_hash, _), result in zip(batch, results) if result["label"] != "error"])
+
+            write_queue.put((chunk_posts, text_scores))
+    except BaseException:
+        stop_event.set()
+        reader.join()
+        write_queue.put(_END_OF_STREAM)
+        writer.join()
+        if os.path.exists(output_path + ".part"):
+            os.remove(output_path + ".part")
+        raise
+    write_queue.put(_END_OF_STREAM)
+    writer.join()
+
+    if writer_errors:
+        raise writer_errors[0]
+    os.replace(output_path + ".part", output_path)  # Only complete results replace the previous ones
+    print(f"Saved sentiment analysis results to {output_path}")
+    return sentiment_counts
+
 # Save analyzed data
 def save_analyzed_data(data, filename):
     filepath = os.path.join(output_dir, filename)
@@ -59,6 +810,28 @@ def save_analyzed_data(data, filename):
         json.dump(data, file, ensure_ascii=False, indent=4)
     print(f"Saved sentiment analysis results to {filepath}")
 
+# Count the sentiment labels of saved results (sentiment_analysis_results.json or, from the streaming mode, .ndjson)
+# The newer of both files is used. Needs neither transformers nor the model.
+def load_saved_sentiment_counts():
+    result_paths = [os.path.join(output_dir, filename) for filename in
+                    ("sentiment_analysis_results.json", "sentiment_analysis_results.ndjson")]
+    result_paths = [path for path in result_paths if os.path.exists(path)]
+    if not result_paths:
+        raise FileNotFoundError(f"No sentiment analysis results found in {output_dir}, run the analysis first.")
+    result_path = max(result_paths, key=os.path.getmtime)
+    print(f"Loading sentiment analysis results from {result_path}...")
+
+    sentiment_counts = {}
+    with open(result_path, "r", encoding="utf-8") as file:
+        if result_path.endswith(".ndjson"):
+            for line in file:
+                if line.strip():
+                    add_sentiment_counts(sentiment_counts, json.loads(line))
+        else:
+            for item in json.load(file):
+                add_sentiment_counts(sentiment_counts, item)
+    return sentiment_counts
+
 # Map BERT labels to human-readable meanings
 BERT_LABELS = {
     "1 star": "Very Negative",
@@ -76,6 +849,8 @@ def sort_sentiment_counts(sentiment_counts):
 
 # Plot sentiment distribution
 def plot_sentiment_distribution_custom(sentiment_counts, successful_texts, version):
+    import matplotlib.pyplot as plt
+
     sorted_counts = sort_sentiment_counts(sentiment_counts)
     labels = [BERT_LABELS[label] for label in sorted_counts.keys()]
     counts = list(sorted_counts.values())
@@ -110,31 +885,52 @@ def plot_sentiment_distribution_custom(sentiment_counts, successful_texts, versi
 
 # Main function
 if __name__ == "__main__":
-    # Load subset
-    input_filename = "cleaned_politics.json"
-    print(f"Loading data from {input_filename}...")
-    data = load_processed_data(input_filename)
+    # Load subset (only the partition of the flair is read)
+    input_flair_name = "Politik | Politics"
+    backend = "pytorch"  # "onnx" or "onnx-int8" for ONNX Runtime on CPU-only machines
+    workers = 1  # Worker processes, each with its own model (see iter_scored_batches)
+    streaming = False  # Stream posts from the partition to NDJSON results instead of loading them all
+    chunk_long_texts = True  # Score texts longer than 512 tokens in overlapping windows instead of truncating them
 
-    print("Performing sentiment analysis...")
-    analyzed_data = perform_sentiment_analysis(data)
+    score_table = SentimentScoreTable()
+    score_table_path = os.path.join(output_dir, "sentiment_scores.npz")
 
-    print("Saving results...")
-    save_analyzed_data(analyzed_data, "sentiment_analysis_results.json")
+    # "python SubRedditSentimentAnalyzer.py plot" only rebuilds the plots from the saved results
+    if len(sys.argv) > 1 and sys.argv[1] == "plot":
+        sentiment_counts = load_saved_sentiment_counts()
+    elif streaming:
+        print(f"Streaming sentiment analysis of posts with flair '{input_flair_name}'...")
+        posts = iter_cleaned_partitions(flairs=[input_flair_name], remove_stopwords=False)
+        cache = SentimentCache(model=get_sentiment_cache_model(backend, chunk_long_texts))
+        sentiment_counts = stream_sentiment_analysis(
+            posts, os.path.join(output_dir, "sentiment_analysis_results.ndjson"), batch_size=DEFAULT_BATCH_SIZE,
+            cache=cache, backend=backend, score_table=score_table, chunk_long_texts=chunk_long_texts)
+        cache.close()
+        score_table.save(score_table_path)
+    else:
+        print(f"Loading cleaned posts with flair '{input_flair_name}'...")
+        data = load_cleaned_partitions(flairs=[input_flair_name], remove_stopwords=False)
 
-    print("\nStatistics:")
-    sentiment_counts = {}
+        print("Performing sentiment analysis...")
+        cache = SentimentCache(model=get_sentiment_cache_model(backend, chunk_long_texts))
+        text_scores = {}
+        analyzed_data = perform_sentiment_analysis_batched(data, batch_size=DEFAULT_BATCH_SIZE, cache=cache,
+                                                           backend=backend, workers=workers, text_scores=text_scores,
+                                                           chunk_long_texts=chunk_long_texts)
+        cache.close()
 
-    # Include both posts and comments in statistics
-    for item in analyzed_data:
-        # Count sentiment for posts
-        sentiment = item.get("sentiment", "unknown")
-        sentiment_counts[sentiment] = sentiment_counts.get(sentiment, 0) + 1
+        print("Saving results...")
+        save_analyzed_data(analyzed_data, "sentiment_analysis_results.json")
+        for item in analyzed_data:
+            score_table.add_post(item, text_scores)
+        score_table.save(score_table_path)
 
-        # Count sentiment for comments
-        for comment in item.get("comments", []):
-            comment_sentiment = comment.get("sentiment", "unknown")
-            sentiment_counts[comment_sentiment] = sentiment_counts.get(comment_sentiment, 0) + 1
+        # Include both posts and comments in statistics
+        sentiment_counts = {}
+        for item in analyzed_data:
+            add_sentiment_counts(sentiment_counts, item)
 
+    print("\nStatistics:")
     total = sum(sentiment_counts.values())
     errors = sentiment_counts.get("error", 0)
     successful = total - errors
@@ -1,5 +1,4 @@
 import os
-import json
 import csv
 from collections import defaultdict
 from datetime import datetime
@@ -8,19 +7,13 @@ import numpy as np
 from scipy.stats import pearsonr
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_absolute_error
+from SubRedditCorpusLoader import load_corpus
+from SubRedditColumnarStore import ensure_columnar_store, load_posts_table, load_comments_table
 
 
-# Function to load from JSON files
+# Function to load from JSON or NDJSON files (cached)
 def load_subreddit_data(directory):
-    posts = []
-    for filename in os.listdir(directory):
-        if filename.startswith("austria_posts_with_comments_") and filename.endswith(".json"):
-            filepath = os.path.join(directory, filename)
-            print(f"Loading file: {filepath}")
-            with open(filepath, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                posts.extend(data)
-    return posts
+    return load_corpus(directory, verbose=True)
 
 
 # Function to calculate general statistics
@@ -53,6 +46,35 @@ def calculate_daily_statistics(posts):
         # Include post upvotes in the total upvotes count
         daily_total_upvote_counts[date] += post.get("upvotes", 0)
 
+    return summarize_daily_statistics(daily_post_counts, daily_comment_counts, daily_post_upvote_counts,
+                                      daily_total_upvote_counts)
+
+
+# Function to calculate daily statistics from the columnar posts and comments tables (vectorized group-bys)
+def calculate_daily_statistics_from_tables(posts_table, comments_table):
+    post_groups = posts_table.group_by("date", use_threads=False).aggregate(
+        [("id", "count"), ("comment_count", "sum"), ("upvotes", "sum")]
+    ).sort_by("date")
+    comment_groups = comments_table.group_by("post_date", use_threads=False).aggregate([("upvotes", "sum")])
+
+    dates = post_groups["date"].to_pylist()
+    comment_upvotes = dict(zip(comment_groups["post_date"].to_pylist(), comment_groups["upvotes_sum"].to_pylist()))
+    post_upvotes = post_groups["upvotes_sum"].to_pylist()
+
+    daily_post_counts = dict(zip(dates, post_groups["id_count"].to_pylist()))
+    daily_comment_counts = dict(zip(dates, post_groups["comment_count_sum"].to_pylist()))
+    daily_post_upvote_counts = dict(zip(dates, post_upvotes))
+    daily_total_upvote_counts = {
+        date: upvotes + comment_upvotes.get(date, 0) for date, upvotes in zip(dates, post_upvotes)
+    }
+
+    return summarize_daily_statistics(daily_post_counts, daily_comment_counts, daily_post_upvote_counts,
+                                      daily_total_upvote_counts)
+
+
+# Function to summarize daily counts (averages, standard deviations, extreme days)
+def summarize_daily_statistics(daily_post_counts, daily_comment_counts, daily_post_upvote_counts,
+                               daily_total_upvote_counts):
     daily_posts = list(daily_post_counts.values())
     daily_comments = list(daily_comment_counts.values())
     daily_post_upvotes = list(daily_post_upvote_counts.values())
@@ -170,6 +192,11 @@ def calculate_comment_upvote_statistics(posts):
         "std_comments_per_upvote": std_ratio
     }
 
+# Function to get upvotes and number of collected comments per post from the columnar posts table
+def get_post_upvotes_and_comments_from_table(posts_table):
+    return posts_table["upvotes"].to_pylist(), posts_table["comment_count"].to_pylist()
+
+
 # ********************************************************************************
 # CORRELATION
 # ********************************************************************************
@@ -327,11 +354,14 @@ def visualize_correlation_with_regression(x, y, x_label, y_label, title, correla
 # Main workflow
 # ********************************************************************************
 if __name__ == "__main__":
-    # Load posts
-    posts = load_subreddit_data("data")
+    # Load the columnar posts and comments tables, only the columns needed here
+    ensure_columnar_store("data")
+    posts_table = load_posts_table(columns=["id", "date", "upvotes", "comment_count"])
+    comments_table = load_comments_table(columns=["post_date", "upvotes"])
+    post_upvotes, post_comments = get_post_upvotes_and_comments_from_table(posts_table)
 
     # Calculate daily statistics
-    daily_stats = calculate_daily_statistics(posts)
+    daily_stats = calculate_daily_statistics_from_tables(posts_table, comments_table)
 
     # Save daily statistics to CSV
     daily_stats_csv = [
@@ -347,7 +377,7 @@ if __name__ == "__main__":
     daily_correlation = calculate_daily_posts_comments_correlation(
         daily_stats["daily_post_counts"], daily_stats["daily_comment_counts"]
     )
-    post_correlation = calculate_post_upvotes_comments_correlation(posts)
+    post_correlation = calculate_correlation(post_upvotes, post_comments)
 
     # Save correlation results
     correlations_csv = [
@@ -362,7 +392,7 @@ if __name__ == "__main__":
     daily_regression = perform_daily_posts_comments_regression(
         daily_stats["daily_post_counts"], daily_stats["daily_comment_counts"]
     )
-    post_regression = perform_post_upvotes_comments_regression(posts)
+    post_regression = perform_linear_regression(post_upvotes, post_comments)
 
     # Save regression results
     regressions_csv = [
@@ -394,8 +424,6 @@ if __name__ == "__main__":
     )
 
     # Visualize correlation between post upvotes and comments
-    post_upvotes = [post.get("upvotes", 0) for post in posts]
-    post_comments = [len(post.get("comments", [])) for post in posts]
     visualize_correlation_with_regression(
         post_upvotes,
         post_comments,
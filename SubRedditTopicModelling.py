@@ -1,84 +1,733 @@
-import json
 import os
+import sys
+import csv
+import json
+import time
+import pickle
+import hashlib
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.special import psi
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
-from gensim.corpora.dictionary import Dictionary
-from gensim.models import CoherenceModel
+from SubRedditCorpusLoader import load_cleaned_partitions, iter_cleaned_partitions, CACHE_DIRECTORY_NAME
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Tokenized corpus of the topic models, cached as one .npz (document-term matrix and token sequences) plus a
+# vocabulary file. The cache is keyed by a hash of the texts, so runs on the same texts skip tokenization.
+TOPIC_CORPUS_DIRECTORY = os.path.join("data", CACHE_DIRECTORY_NAME, "topic_corpus")
+TOPIC_CORPUS_FILENAME = "topic_corpus.npz"
+TOPIC_VOCABULARY_FILENAME = "topic_vocabulary.json"
+
+# Tokens as CountVectorizer finds them by default, and the vocabulary limits of the LDA
+TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+MAX_DF = 0.95
+MIN_DF = 2
+
+# Coherence measures of CoherenceScorer with their sliding window sizes, the same as gensim's CoherenceModel
+# (None counts co-occurrences in whole documents)
+COHERENCE_WINDOW_SIZES = {"c_v": 110, "c_npmi": 10, "u_mass": None}
+COHERENCE_EPSILON = 1e-12
+
+# Fitted topic model for reuse, written by the topic count sweep
+TOPIC_MODEL_PATH = os.path.join("results", "models", "topic_model.pkl")
+
+# Checkpoint of the online topic model, updated with the posts of every new day
+ONLINE_TOPIC_MODEL_PATH = os.path.join("results", "models", "online_topic_model.pkl")
+
+# Topic distributions of all posts and comments under the saved topic model
+TOPIC_ASSIGNMENTS_PATH = os.path.join("results", "topic_assignments.npz")
+
+
+# Texts of a post for the topic models: title and selftext combined, plus one text per comment
+def collect_topic_texts(post):
+    texts = [post.get("title", "") + " " + post.get("selftext", "")]
+    texts.extend(comment.get("cleaned_body", "") for comment in post.get("comments", []))
+    return texts
+
+
+# Cache key of a list of texts and the tokenizer settings
+def get_corpus_key(texts):
+    digest = hashlib.blake2b(TOKEN_PATTERN.encode("utf-8"), digest_size=16)
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+# Corpus tokenized once, shared by the LDA and the coherence computation
+# vocabulary: all tokens in sorted order (like CountVectorizer), dtm: CSR document-term counts over the whole
+# vocabulary, token_ids/token_offsets: the token sequence of every document (document i is
+# token_ids[token_offsets[i]:token_offsets[i + 1]]), needed by the sliding windows of c_v.
+class TopicCorpus:
+    def __init__(self, vocabulary, dtm, token_ids, token_offsets, key=None):
+        self.vocabulary = vocabulary
+        self.dtm = dtm
+        self.token_ids = token_ids
+        self.token_offsets = token_offsets
+        self.key = key
+
+    # Tokenize the texts in a single pass
+    @classmethod
+    def from_texts(cls, texts, key=None):
+        analyzer = CountVectorizer(token_pattern=TOKEN_PATTERN).build_analyzer()
+        token2id = {}
+        token_ids = []
+        token_offsets = [0]
+        for text in texts:
+            token_ids.extend([token2id.setdefault(token, len(token2id)) for token in analyzer(text)])
+            token_offsets.append(len(token_ids))
+
+        # Renumber the tokens in sorted order, so the columns match a CountVectorizer on the same texts
+        vocabulary = np.array(list(token2id), dtype=str)
+        order = np.argsort(vocabulary, kind="stable")
+        new_ids = np.empty(len(order), dtype=np.int32)
+        new_ids[order] = np.arange(len(order), dtype=np.int32)
+        token_ids = new_ids[np.array(token_ids, dtype=np.int32)]
+        token_offsets = np.array(token_offsets, dtype=np.int64)
+
+        # Duplicate (document, token) entries are summed into counts
+        rows = np.repeat(np.arange(len(token_offsets) - 1, dtype=np.int32), np.diff(token_offsets))
+        dtm = csr_matrix((np.ones(len(token_ids), dtype=np.int64), (rows, token_ids)),
+                         shape=(len(token_offsets) - 1, len(order)))
+        dtm.sort_indices()
+        return cls(vocabulary[order], dtm, token_ids, token_offsets, key)
+
+    @property
+    def num_documents(self):
+        return self.dtm.shape[0]
+
+    # Document-term matrix and words of the LDA, terms are pruned by document frequency like CountVectorizer
+    # (max_df/min_df: a share of the documents as float or a number of documents as int)
+    def get_document_term_matrix(self, max_df=MAX_DF, min_df=MIN_DF):
+        document_frequency = np.bincount(self.dtm.indices, minlength=len(self.vocabulary))
+        max_count = max_df if isinstance(max_df, int) else max_df * self.num_documents
+        min_count = min_df if isinstance(min_df, int) else min_df * self.num_documents
+        terms = np.flatnonzero((document_frequency <= max_count) & (document_frequency >= min_count))
+        if len(terms) == 0:
+            raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+        return self.dtm[:, terms], self.vocabulary[terms]
+
+    # Token lists of all documents, rebuilt from the token ids without tokenizing again
+    def get_tokenized_texts(self):
+        words = self.vocabulary[self.token_ids].tolist()
+        offsets = self.token_offsets.tolist()
+        return [words[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    # Gensim dictionary over the same vocabulary (token ids are the column numbers of dtm)
+    def get_dictionary(self):
+        from gensim.corpora.dictionary import Dictionary
+
+        dictionary = Dictionary()
+        dictionary.token2id = {word: token_id for token_id, word in enumerate(self.vocabulary.tolist())}
+        return dictionary
+
+    # Write the corpus to the cache, the key is stored in both files so a half-written cache is never used
+    def save(self, directory=TOPIC_CORPUS_DIRECTORY):
+        os.makedirs(directory, exist_ok=True)
+        corpus_path = os.path.join(directory, TOPIC_CORPUS_FILENAME)
+        vocabulary_path = os.path.join(directory, TOPIC_VOCABULARY_FILENAME)
+        with open(corpus_path + ".tmp", "wb") as file:
+            np.savez(file, key=np.array(self.key or ""), data=self.dtm.data, indices=self.dtm.indices,
+                     indptr=self.dtm.indptr, shape=np.array(self.dtm.shape), token_ids=self.token_ids,
+                     token_offsets=self.token_offsets)
+        with open(vocabulary_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump({"key": self.key, "vocabulary": self.vocabulary.tolist()}, file, ensure_ascii=False)
+        os.replace(corpus_path + ".tmp", corpus_path)
+        os.replace(vocabulary_path + ".tmp", vocabulary_path)
+
+    # Read the corpus from the cache, None if it is missing or was built from other texts
+    @classmethod
+    def load(cls, key, directory=TOPIC_CORPUS_DIRECTORY):
+        corpus_path = os.path.join(directory, TOPIC_CORPUS_FILENAME)
+        vocabulary_path = os.path.join(directory, TOPIC_VOCABULARY_FILENAME)
+        if not os.path.exists(corpus_path) or not os.path.exists(vocabulary_path):
+            return None
+        with open(vocabulary_path, "r", encoding="utf-8") as file:
+            vocabulary = json.load(file)
+        if vocabulary["key"] != key:
+            return None
+        with np.load(corpus_path) as arrays:
+            if str(arrays["key"]) != key:
+                return None
+            dtm = csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=tuple(arrays["shape"]))
+            return cls(np.array(vocabulary["vocabulary"], dtype=str), dtm, arrays["token_ids"],
+                       arrays["token_offsets"], key)
+
+
+# Tokenize the texts or load them from the cache if the same texts were tokenized before
+def prepare_topic_corpus(texts, directory=TOPIC_CORPUS_DIRECTORY, use_cache=True):
+    key = get_corpus_key(texts)
+    corpus = TopicCorpus.load(key, directory) if use_cache else None
+    if corpus is not None:
+        print(f"Loaded tokenized corpus from {directory} ({corpus.num_documents} documents, "
+              f"{len(corpus.vocabulary)} tokens).")
+        return corpus
+
+    corpus = TopicCorpus.from_texts(texts, key)
+    if use_cache:
+        corpus.save(directory)
+    print(f"Tokenized {corpus.num_documents} documents, {len(corpus.vocabulary)} tokens.")
+    return corpus
+
+
+# Co-occurrence counts of words (ids of the corpus vocabulary) in sliding windows over the token sequences
+# Returns the symmetric count matrix (occurrences on the diagonal) and the number of windows. Windows are counted
+# like gensim's WordOccurrenceAccumulator: a document shorter than the window is one window, and a word leaves the
+# window with its occurrence at the window's left edge, even if it occurs again inside the window. An occurrence at
+# position p therefore covers the windows from p - window_size + 1 up to the first occurrence of the word at or
+# after that window. The covered windows are expanded into a sparse (windows x words) matrix, in chunks of whole
+# documents with at most max_entries entries, and the counts are its Gram matrix.
+# window_size=None counts co-occurrences in whole documents from the document-term matrix instead.
+def count_cooccurrences(corpus, word_ids, window_size=None, max_entries=20_000_000):
+    word_ids = np.asarray(word_ids, dtype=np.int64)
+    num_words = len(word_ids)
+    if window_size is None:
+        occurs = (corpus.dtm[:, word_ids] > 0).astype(np.int64)
+        return (occurs.T @ occurs).toarray(), corpus.num_documents
+
+    lengths = np.diff(corpus.token_offsets)
+    windows_per_document = np.maximum(lengths - window_size + 1, 1)
+    window_offsets = np.concatenate([[0], np.cumsum(windows_per_document)])
+
+    # Occurrences of the relevant words, sorted by document, word and position
+    columns = np.full(len(corpus.vocabulary), -1, dtype=np.int64)
+    columns[word_ids] = np.arange(num_words)
+    positions = np.flatnonzero(columns[corpus.token_ids] >= 0)
+    documents = np.searchsorted(corpus.token_offsets, positions, side="right") - 1
+    words = columns[corpus.token_ids[positions]]
+    positions = positions - corpus.token_offsets[documents]
+    order = np.lexsort((positions, words, documents))
+    documents, words, positions = documents[order], words[order], positions[order]
+
+    # Windows covered by every occurrence, overlaps with the previous occurrence of the same word are cut off
+    groups = documents * num_words + words
+    keys = groups * (int(lengths.max(initial=0)) + 1) + positions
+    starts = np.maximum(positions - window_size + 1, 0)
+    first_after = positions[np.searchsorted(keys, keys - positions + starts)]
+    ends = np.minimum(first_after, windows_per_document[documents] - 1)
+    same_group = np.concatenate([[False], groups[1:] == groups[:-1]])
+    previous_ends = np.concatenate([[-1], ends[:-1]])
+    starts = np.where(same_group, np.maximum(starts, previous_ends + 1), starts)
+    counts = np.maximum(ends - starts + 1, 0)
+
+    cooccurrences = np.zeros((num_words, num_words), dtype=np.int64)
+    entries_per_document = np.bincount(documents, weights=counts, minlength=len(lengths))
+    cumulative_entries = np.cumsum(entries_per_document)
+    chunk_start = 0
+    first_document = 0
+    while chunk_start < len(counts):
+        # Whole documents up to max_entries (at least one), so no window is split between chunks
+        last_document = max(int(np.searchsorted(cumulative_entries, cumulative_entries[first_document]
+                                                - entries_per_document[first_document] + max_entries,
+                                                side="right")), first_document + 1)
+        chunk_end = int(np.searchsorted(documents, last_document, side="left"))
+        chunk_counts = counts[chunk_start:chunk_end]
+        total = int(chunk_counts.sum())
+        if total:
+            first_windows = window_offsets[documents[chunk_start:chunk_end]] + starts[chunk_start:chunk_end]
+            steps = np.arange(total) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+            rows = np.repeat(first_windows, chunk_counts) + steps
+            rows -= rows.min()
+            occurs = csr_matrix((np.ones(total, dtype=np.int64), (rows, np.repeat(words[chunk_start:chunk_end],
+                                                                                 chunk_counts))),
+                                shape=(int(rows.max()) + 1, num_words))
+            cooccurrences += (occurs.T @ occurs).toarray()
+        chunk_start = chunk_end
+        first_document = last_document
+    return cooccurrences, int(window_offsets[-1])
+
+
+# Topic coherence (c_v, c_npmi or u_mass) computed from co-occurrence counts of the topic words only
+# The numbers follow gensim's CoherenceModel for the same tokens. Counts are cached per window size for all
+# words seen so far, so scoring the topics of several topic counts counts co-occurrences once (call prepare with
+# the topics of all of them first, a word that is not cached yet triggers a new count for all cached words).
+class CoherenceScorer:
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.counts = {}  # window size -> (word ids, position of each word id, co-occurrence counts, windows)
+        self.token2id = {word: token_id for token_id, word in enumerate(corpus.vocabulary.tolist())}
+
+    # Count co-occurrences for the words of all given topics (word lists) that aren't cached yet
+    def prepare(self, topics, measure="c_v"):
+        window_size = COHERENCE_WINDOW_SIZES[measure]
+        word_ids = {self.token2id[word] for words in topics for word in words}
+        cached = self.counts.get(window_size)
+        if cached is not None and word_ids <= cached[1].keys():
+            return cached
+        if cached is not None:
+            word_ids |= cached[1].keys()
+        word_ids = sorted(word_ids)
+        cooccurrences, num_windows = count_cooccurrences(self.corpus, word_ids, window_size)
+        self.counts[window_size] = (word_ids, {word_id: index for index, word_id in enumerate(word_ids)},
+                                    cooccurrences, num_windows)
+        return self.counts[window_size]
+
+    # Coherence of every topic
+    def coherence_per_topic(self, topics, measure="c_v"):
+        topics = [list(words) for words in topics]
+        _, positions, cooccurrences, num_windows = self.prepare(topics, measure)
+        scores = []
+        for words in topics:
+            index = [positions[self.token2id[word]] for word in words]
+            joint = cooccurrences[np.ix_(index, index)] / num_windows
+            single = np.diagonal(joint)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if measure == "u_mass":
+                    # log P(w_i, w_j) / P(w_j) for every word w_i and the words w_j before it
+                    lower = np.tril_indices(len(index), -1)
+                    ratios = np.log((joint[lower] + COHERENCE_EPSILON) / single[lower[1]])
+                    scores.append(float(np.mean(np.where(single[lower[1]] > 0, ratios, 0.0))))
+                    continue
+                npmi = (np.log((joint + COHERENCE_EPSILON) / np.outer(single, single))
+                        / -np.log(joint + COHERENCE_EPSILON))
+                if measure == "c_npmi":
+                    scores.append(float(npmi[~np.eye(len(index), dtype=bool)].mean()))
+                else:
+                    # Cosine of the NPMI vector of every word with the summed NPMI vector of the topic
+                    topic_vector = npmi.sum(axis=0)
+                    cosines = npmi @ topic_vector / (np.linalg.norm(npmi, axis=1) * np.linalg.norm(topic_vector))
+                    scores.append(float(cosines.mean()))
+        return scores
+
+    # Mean coherence of the topics
+    def coherence(self, topics, measure="c_v"):
+        return float(np.mean(self.coherence_per_topic(topics, measure)))
+
+
+# Coherence of topics given as word lists (c_v by default), a scorer can be passed in to reuse its counts
+def compute_coherence(corpus, topic_words, measure="c_v", scorer=None):
+    scorer = scorer or CoherenceScorer(corpus)
+    return scorer.coherence(list(topic_words), measure)
+
+
+# Top words of every topic of a fitted LDA
+def get_topic_words(lda, words, num_words=10):
+    return {f"Topic {i + 1}": [words[idx] for idx in topic.argsort()[-num_words:][::-1]] for i, topic in enumerate(lda.components_)}
+
 
 # Perform topic modeling and calculate coherence
-def perform_topic_modeling(texts, num_topics=5, num_words=10):
-    # Vectorize texts using CountVectorizer
-    vectorizer = CountVectorizer(max_df=0.95, min_df=2)
-    dtm = vectorizer.fit_transform(texts)
+# corpus is a TopicCorpus from prepare_topic_corpus, or a list of texts that is tokenized without the cache
+# With a model_path, the fitted LDA is saved there for assign_topics.
+def perform_topic_modeling(corpus, num_topics=5, num_words=10, model_path=None):
+    if not isinstance(corpus, TopicCorpus):
+        corpus = TopicCorpus.from_texts(corpus)
+
+    # The LDA works on the pruned document-term matrix of the shared corpus
+    dtm, words = corpus.get_document_term_matrix()
     lda = LatentDirichletAllocation(n_components=num_topics, random_state=42)
     lda.fit(dtm)
 
     # Extract words and topics
-    words = vectorizer.get_feature_names_out()
-    topics = {f"Topic {i + 1}": [words[idx] for idx in topic.argsort()[-num_words:][::-1]] for i, topic in enumerate(lda.components_)}
-
-    # Prepare texts for Gensim coherence model
-    tokenized_texts = [text.split() for text in texts]
-    dictionary = Dictionary(tokenized_texts)
-    corpus = [dictionary.doc2bow(text) for text in tokenized_texts]
-
-    # Use topics directly from LDA for Gensim coherence
-    gensim_topics = [[dictionary.token2id[word] for word in topic if word in dictionary.token2id] for topic in topics.values()]
-    coherence_model = CoherenceModel(
-        topics=gensim_topics,
-        texts=tokenized_texts,
-        dictionary=dictionary,
-        coherence="c_v"
-    )
-    coherence_score = coherence_model.get_coherence()
+    topics = get_topic_words(lda, words, num_words)
+
+    # Coherence uses the same tokens and vocabulary as the LDA
+    coherence_score = compute_coherence(corpus, topics.values())
 
+    if model_path is not None:
+        save_topic_model(lda, words, model_path, num_topics=num_topics, coherence=coherence_score,
+                         corpus_key=corpus.key)
     return topics, coherence_score
 
 
+# Save a fitted LDA with its vocabulary, so documents can be assigned to topics later without refitting
+def save_topic_model(lda, words, path=TOPIC_MODEL_PATH, **metadata):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as file:
+        pickle.dump(dict(metadata, lda=lda, vocabulary=list(words)), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+    print(f"Topic model saved to {path}.")
+
+
+# Load a topic model saved by save_topic_model, a dict with "lda", "vocabulary" and the saved metadata
+def load_topic_model(path=TOPIC_MODEL_PATH):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File not found: {path}. Please run 'SubRedditTopicModelling.py' first.")
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+# Pruned document-term matrix and words of a sweep worker, set once by init_sweep_worker
+_worker_dtm = None
+_worker_words = None
+
+
+# Initializer of the sweep workers: the corpus is sent once per worker and shared by all of its fits
+def init_sweep_worker(corpus):
+    global _worker_dtm, _worker_words
+    _worker_dtm, _worker_words = corpus.get_document_term_matrix()
+
+
+# Fit the LDA for one topic count (runs in the sweep's process pool)
+def fit_topic_count(num_topics, num_words=10):
+    start_time = time.perf_counter()
+    lda = LatentDirichletAllocation(n_components=num_topics, random_state=42)
+    lda.fit(_worker_dtm)
+    fit_time = time.perf_counter() - start_time
+
+    return {
+        "num_topics": num_topics,
+        "perplexity": float(lda.perplexity(_worker_dtm)),
+        "fit_time": fit_time,
+        "topics": get_topic_words(lda, _worker_words, num_words),
+    }, lda
+
+
+# Fit the LDA for every topic count in parallel and rank the fits by c_v coherence (best first)
+# Perplexity is measured on the training documents. The coherence of all fits is computed afterwards from one
+# count of the co-occurrences of all their topic words. Returns the ranked results and the best LDA.
+def sweep_topic_counts(corpus, topic_counts, num_words=10, workers=None):
+    workers = workers or os.cpu_count() or 1
+    results = []
+    models = {}
+    # The largest models take longest, they are started first
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_sweep_worker, initargs=(corpus,)) as executor:
+        futures = [executor.submit(fit_topic_count, num_topics, num_words)
+                   for num_topics in sorted(topic_counts, reverse=True)]
+        for future in as_completed(futures):
+            result, lda = future.result()
+            print(f"k={result['num_topics']}: perplexity {result['perplexity']:.1f}, fit {result['fit_time']:.1f} s")
+            results.append(result)
+            models[result["num_topics"]] = lda
+
+    scorer = CoherenceScorer(corpus)
+    scorer.prepare([words for result in results for words in result["topics"].values()])
+    for result in results:
+        result["coherence"] = scorer.coherence(result["topics"].values())
+    results.sort(key=lambda result: result["coherence"], reverse=True)
+    return results, models[results[0]["num_topics"]]
+
+
+# Save the ranked sweep as JSON (with the topics) and CSV (one row per topic count)
+def save_sweep_results(results, json_path, csv_path):
+    with open(json_path, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=4)
+    with open(csv_path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file, delimiter=";")
+        writer.writerow(["rank", "num_topics", "coherence", "perplexity", "fit_time"])
+        for rank, result in enumerate(results, start=1):
+            writer.writerow([rank, result["num_topics"], f"{result['coherence']:.4f}",
+                             f"{result['perplexity']:.2f}", f"{result['fit_time']:.2f}"])
+    print(f"Sweep results saved to {json_path} and {csv_path}.")
+
+
+# LDA learned online in minibatches with partial_fit, so new days update the topics instead of refitting them
+# The vocabulary grows with tokens that appear in at least min_df documents of a minibatch (their topic-word
+# weights start like a fresh LDA's). With grow_vocabulary=False it stays fixed to the given vocabulary or, without
+# one, to the vocabulary of the first minibatch. Learned posts are recorded by id, so an update only learns
+# posts that are new since the last checkpoint.
+class OnlineTopicModel:
+    def __init__(self, num_topics=5, vocabulary=None, grow_vocabulary=True, min_df=MIN_DF, random_state=42):
+        self.lda = LatentDirichletAllocation(n_components=num_topics, learning_method="online",
+                                             random_state=random_state)
+        self.vocabulary = list(vocabulary or [])
+        self.token2id = {word: token_id for token_id, word in enumerate(self.vocabulary)}
+        self.grow_vocabulary = grow_vocabulary
+        self.min_df = min_df
+        self.num_documents = 0
+        self.learned_post_ids = set()
+        self.learned_days = set()
+
+    # Add the tokens of a minibatch that are frequent enough, returns the number of new tokens
+    def _grow(self, batch):
+        document_frequency = np.bincount(batch.dtm.indices, minlength=len(batch.vocabulary))
+        new_words = [word for word, frequency in zip(batch.vocabulary.tolist(), document_frequency.tolist())
+                     if frequency >= self.min_df and word not in self.token2id]
+        for word in new_words:
+            self.token2id[word] = len(self.vocabulary)
+            self.vocabulary.append(word)
+
+        # New columns of a fitted LDA are initialized like LatentDirichletAllocation._init_latent_vars does
+        if new_words and hasattr(self.lda, "components_"):
+            new_components = self.lda.random_state_.gamma(100.0, 0.01, (self.lda.n_components, len(new_words)))
+            self.lda.components_ = np.hstack([self.lda.components_, new_components])
+            self.lda.exp_dirichlet_component_ = np.exp(
+                psi(self.lda.components_) - psi(self.lda.components_.sum(axis=1))[:, np.newaxis])
+            self.lda.n_features_in_ = self.lda.components_.shape[1]
+        return len(new_words)
+
+    # Document-term matrix of a minibatch in the columns of the model vocabulary, unknown tokens are dropped
+    def _vectorize(self, batch):
+        columns = np.array([self.token2id.get(word, -1) for word in batch.vocabulary.tolist()], dtype=np.int64)
+        counts = batch.dtm.tocoo()
+        known = columns[counts.col] >= 0
+        return csr_matrix((counts.data[known], (counts.row[known], columns[counts.col[known]])),
+                          shape=(batch.num_documents, len(self.vocabulary)))
+
+    # Learn one minibatch of texts
+    def partial_fit_texts(self, texts):
+        batch = TopicCorpus.from_texts(texts)
+        if self.grow_vocabulary or not self.vocabulary:
+            self._grow(batch)
+        if not self.vocabulary:
+            return
+        self.num_documents += len(texts)
+        # The M-step weights a minibatch by total_samples / batch size, the corpus is as large as seen so far
+        self.lda.total_samples = self.num_documents
+        self.lda.partial_fit(self._vectorize(batch))
+
+    # Learn the posts that are not learned yet, their texts are streamed in minibatches of about batch_size
+    # Every checkpoint_every minibatches (and at the end) the model is saved to checkpoint_path, if given.
+    def update(self, posts, batch_size=2048, checkpoint_path=None, checkpoint_every=50):
+        texts = []
+        post_ids = []
+        days = set()
+        num_batches = 0
+        num_posts = 0
+
+        def learn():
+            nonlocal texts, post_ids, days, num_batches
+            self.partial_fit_texts(texts)
+            self.learned_post_ids.update(post_ids)
+            self.learned_days.update(days)
+            texts, post_ids, days = [], [], set()
+            num_batches += 1
+            if checkpoint_path is not None and num_batches % checkpoint_every == 0:
+                self.save(checkpoint_path)
+
+        for post in posts:
+            if post.get("id") in self.learned_post_ids:
+                continue
+            texts.extend(collect_topic_texts(post))
+            post_ids.append(post.get("id"))
+            days.add(utc_day(post.get("created_utc", 0)))
+            num_posts += 1
+            if len(texts) >= batch_size:
+                learn()
+        if texts:
+            learn()
+
+        if checkpoint_path is not None:
+            self.save(checkpoint_path)
+        print(f"Learned {num_posts} new posts in {num_batches} minibatch(es), "
+              f"{self.num_documents} documents and {len(self.vocabulary)} tokens in total.")
+        return num_posts
+
+    # Top words of every topic
+    def get_topics(self, num_words=10):
+        return get_topic_words(self.lda, self.vocabulary, num_words)
+
+    # Write the checkpoint
+    def save(self, path=ONLINE_TOPIC_MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    # Read a checkpoint, None if there is none yet
+    @staticmethod
+    def load(path=ONLINE_TOPIC_MODEL_PATH):
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+
+# Topic distributions of posts and comments, one float32 row per document (the title and selftext of a post are
+# one document, every comment is one), aligned with the ids, post ids, flair and UTC day of the documents
+class TopicAssignmentTable:
+    def __init__(self):
+        self.ids = []
+        self.post_ids = []
+        self.is_comment = []
+        self.flairs = []
+        self.created_utc = []
+        self.num_tokens = []
+        self.topics = []  # One (documents x topics) array per assigned chunk
+
+    # Add the documents of a post and its comments (without their distributions, see assign_topics)
+    def add_post(self, post):
+        for target in [post] + post.get("comments", []):
+            self.ids.append(target.get("id", ""))
+            self.post_ids.append(post.get("id", ""))
+            self.is_comment.append(target is not post)
+            self.flairs.append(post.get("flair") or "")
+            self.created_utc.append(target.get("created_utc", post.get("created_utc", 0)))
+
+    # The table as NumPy arrays, one row per document
+    def to_arrays(self):
+        num_topics = self.topics[0].shape[1] if self.topics else 0
+        return {
+            "id": np.array(self.ids, dtype=str),
+            "post_id": np.array(self.post_ids, dtype=str),
+            "is_comment": np.array(self.is_comment, dtype=bool),
+            "flair": np.array(self.flairs, dtype=str),
+            "day": (np.array(self.created_utc, dtype=np.int64) // 86400).astype("datetime64[D]"),
+            "num_tokens": np.array(self.num_tokens, dtype=np.int32),
+            "topics": np.concatenate(self.topics) if self.topics else np.zeros((0, num_topics), dtype=np.float32),
+        }
+
+    def save(self, path=TOPIC_ASSIGNMENTS_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, **self.to_arrays())
+        print(f"Saved topic distributions of {len(self.ids)} documents to {path}")
+
+
+# Assign all posts and comments to topics, lda and vocabulary come from load_topic_model
+# Posts can be a stream (e.g. iter_cleaned_partitions). Their texts are transformed in chunks of about batch_size
+# documents, so only one chunk of texts is held in memory next to the compact table.
+def assign_topics(posts, lda, vocabulary, batch_size=4096, table=None):
+    vectorizer = CountVectorizer(token_pattern=TOKEN_PATTERN, vocabulary=list(vocabulary))
+    table = table if table is not None else TopicAssignmentTable()
+    texts = []
+
+    def assign():
+        dtm = vectorizer.transform(texts)
+        table.topics.append(lda.transform(dtm).astype(np.float32))
+        table.num_tokens.extend(np.asarray(dtm.sum(axis=1)).ravel().tolist())
+        texts.clear()
+
+    for post in posts:
+        table.add_post(post)
+        texts.extend(collect_topic_texts(post))
+        if len(texts) >= batch_size:
+            assign()
+    if texts:
+        assign()
+    return table
+
+
+# Load a table saved by TopicAssignmentTable.save as a dict of NumPy arrays
+def load_topic_assignments(path=TOPIC_ASSIGNMENTS_PATH):
+    with np.load(path) as table:
+        return {name: table[name] for name in table.files}
+
+
+# Topic shares per group with vectorized NumPy operations, e.g. aggregate_topic_shares(table, ("day", "flair"))
+# Returns per column of the table: the groups, number of documents, share of every topic (mean topic
+# distribution of the documents) and the number of documents whose most likely topic it is. Documents without
+# a token of the vocabulary get a uniform distribution from the LDA, they are left out unless include_empty is set.
+def aggregate_topic_shares(table, by=("day", "flair"), include_empty=False):
+    keep = np.ones(len(table["topics"]), dtype=bool) if include_empty else table["num_tokens"] > 0
+    topics = table["topics"][keep]
+    num_topics = topics.shape[1]
+
+    aggregates = {}
+    for column in by:
+        groups, inverse = np.unique(table[column][keep], return_inverse=True)
+        inverse = inverse.reshape(-1)
+        # Sparse (groups x documents) indicator matrix, its product with the distributions sums them per group
+        membership = csr_matrix((np.ones(len(inverse), dtype=np.float32), (inverse, np.arange(len(inverse)))),
+                                shape=(len(groups), len(inverse)))
+        counts = np.bincount(inverse, minlength=len(groups))
+        aggregates[column] = {
+            "groups": groups,
+            "count": counts,
+            "shares": np.asarray(membership @ topics) / np.maximum(counts, 1)[:, None],
+            "dominant": np.bincount(inverse * num_topics + topics.argmax(axis=1),
+                                    minlength=len(groups) * num_topics).reshape(len(groups), num_topics),
+        }
+    return aggregates
+
+
+# Save the topic shares of one aggregate column as CSV, one row per group
+def save_topic_shares_to_csv(aggregate, path, column):
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file, delimiter=";")
+        writer.writerow([column, "documents"] + [f"Topic {i + 1}" for i in range(aggregate["shares"].shape[1])])
+        for group, count, shares in zip(aggregate["groups"].tolist(), aggregate["count"].tolist(),
+                                        aggregate["shares"].tolist()):
+            writer.writerow([group, count] + [f"{share:.4f}" for share in shares])
+    print(f"Topic shares per {column} saved to {path}.")
+
+
+# UTC day of a UNIX timestamp as "YYYY-MM-DD"
+def utc_day(timestamp):
+    return str(np.datetime64(int(timestamp) // 86400, "D"))
+
+
 # Main function
 if __name__ == "__main__":
     # Define input and output paths
-    data_directory = "data"
     results_directory = "results"
     plots_directory = os.path.join(results_directory, "plots")
     json_directory = os.path.join(results_directory, "json")
     os.makedirs(plots_directory, exist_ok=True)
     os.makedirs(json_directory, exist_ok=True)
 
-    input_filename = "cleaned_politics_no_stopwords.json"
-    filepath = os.path.join(data_directory, input_filename)
-
-    print("Loading filtered posts...")
-    if not os.path.exists(filepath):
-        print(f"File not found: {filepath}. Please run 'SubRedditTextCleaner.py' first.")
-        exit()
-
-    with open(filepath, "r", encoding="utf-8") as file:
-        posts = json.load(file)
+    input_flair_name = "Politik | Politics"
+    num_topics = 4
+    num_words = 10
+    mode = sys.argv[1] if len(sys.argv) > 1 else None
 
-    # Preprocess texts
-    print("Preprocessing texts...")
-    texts = []
-    for post in posts:
-        # Combine title and selftext
-        combined_text = post.get("title", "") + " " + post.get("selftext", "")
-        texts.append(combined_text)
+    # "python SubRedditTopicModelling.py online" updates the checkpointed online model with the posts it hasn't
+    # learned yet (e.g. the newest day) instead of fitting on all texts again
+    grow_vocabulary = True
+    online_batch_size = 2048
+    # "python SubRedditTopicModelling.py assign" computes the topic distribution of every post and comment under the
+    # saved topic model and the topic shares per day and flair
+    assign_flairs = None  # None assigns the posts of all flairs
+    if mode == "online":
+        print("Streaming filtered posts...")
+        try:
+            posts = iter_cleaned_partitions(flairs=[input_flair_name], remove_stopwords=True)
+            online_model = OnlineTopicModel.load(ONLINE_TOPIC_MODEL_PATH)
+            if online_model is None:
+                print("No checkpoint found, starting a new online topic model...")
+                online_model = OnlineTopicModel(num_topics, grow_vocabulary=grow_vocabulary)
+            online_model.update(posts, online_batch_size, checkpoint_path=ONLINE_TOPIC_MODEL_PATH)
+        except FileNotFoundError as error:
+            print(error)
+            exit()
+        print(f"Checkpoint saved to {ONLINE_TOPIC_MODEL_PATH} ({len(online_model.learned_days)} day(s) learned).")
+        topics, coherence_score = online_model.get_topics(num_words), None
+    elif mode == "assign":
+        try:
+            topic_model = load_topic_model(TOPIC_MODEL_PATH)
+            print("Assigning posts and comments to topics...")
+            posts = iter_cleaned_partitions(flairs=assign_flairs, remove_stopwords=True)
+            assignments = assign_topics(posts, topic_model["lda"], topic_model["vocabulary"])
+        except FileNotFoundError as error:
+            print(error)
+            exit()
+        assignments.save(TOPIC_ASSIGNMENTS_PATH)
+        topic_shares = aggregate_topic_shares(assignments.to_arrays(), by=("day", "flair"))
+        save_topic_shares_to_csv(topic_shares["day"], os.path.join(results_directory, "topic_shares_per_day.csv"),
+                                 "day")
+        save_topic_shares_to_csv(topic_shares["flair"], os.path.join(results_directory, "topic_shares_per_flair.csv"),
+                                 "flair")
+        topics = get_topic_words(topic_model["lda"], topic_model["vocabulary"], num_words)
+        coherence_score = topic_model.get("coherence")
+    else:
+        print("Loading filtered posts...")
+        try:
+            posts = load_cleaned_partitions(flairs=[input_flair_name], remove_stopwords=True)
+        except FileNotFoundError as error:
+            print(error)
+            exit()
 
-        # Include comments
-        for comment in post.get("comments", []):
-            comment_text = comment.get("cleaned_body", "")
-            texts.append(comment_text)
+        # Preprocess texts: title and selftext combined, plus the comments
+        print("Preprocessing texts...")
+        texts = [text for post in posts for text in collect_topic_texts(post)]
+        print(f"Total texts after preprocessing: {len(texts)}")
 
-    print(f"Total texts after preprocessing: {len(texts)}")
+        # Tokenize once, later runs on the same texts (e.g. with another num_topics) load the cached corpus
+        print("Preparing corpus...")
+        corpus = prepare_topic_corpus(texts)
 
-    # Perform topic modeling
-    print("Performing topic modeling...")
-    num_topics = 4
-    num_words = 10
-    topics, coherence_score = perform_topic_modeling(texts, num_topics, num_words)
+        # "python SubRedditTopicModelling.py sweep" fits every topic count of sweep_topic_count_range in parallel
+        # instead and saves the model with the best coherence
+        sweep_topic_count_range = range(2, 13)
+        workers = None  # None uses one worker per CPU
+        if mode == "sweep":
+            print(f"Sweeping {len(sweep_topic_count_range)} topic counts...")
+            sweep_results, best_lda = sweep_topic_counts(corpus, sweep_topic_count_range, num_words, workers)
+            save_sweep_results(sweep_results, os.path.join(json_directory, "topic_sweep.json"),
+                               os.path.join(results_directory, "topic_sweep.csv"))
+            best = sweep_results[0]
+            save_topic_model(best_lda, corpus.get_document_term_matrix()[1], num_topics=best["num_topics"],
+                             coherence=best["coherence"], corpus_key=corpus.key)
+            num_topics = best["num_topics"]
+            topics, coherence_score = best["topics"], best["coherence"]
+            print(f"Best topic count: {num_topics}")
+        else:
+            # Perform topic modeling
+            print("Performing topic modeling...")
+            topics, coherence_score = perform_topic_modeling(corpus, num_topics, num_words, TOPIC_MODEL_PATH)
 
     # Display topics and coherence score
-    print(f"Topic Coherence: {coherence_score:.2f}")
+    if coherence_score is not None:
+        print(f"Topic Coherence: {coherence_score:.2f}")
     for topic, words in topics.items():
         print(f"{topic}: {', '.join(words)}")
 
@@ -87,4 +736,3 @@ if __name__ == "__main__":
     with open(topics_json_path, "w", encoding="utf-8") as file:
         json.dump(topics, file, ensure_ascii=False, indent=4)
     print(f"Topics saved to {topics_json_path}.")
-
@@ -1,5 +1,4 @@
 import os
-import json
 import csv
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
@@ -7,21 +6,19 @@ import numpy as np
 from PIL import Image
 import random
 from collections import Counter
+from SubRedditCorpusLoader import load_cleaned_partitions
 
 # Function to load cleaned posts
-def load_cleaned_posts(filename):
-    """Loads cleaned posts from a specified JSON file."""
-    data_directory = "data"
-    filepath = os.path.join(data_directory, filename)
-    if not os.path.exists(filepath):
-        print(f"File not found: {filepath}")
-        print("Please run 'SubRedditTextCleaner.py' to generate the cleaned data.")
+def load_cleaned_posts(flairs=None, remove_stopwords=True):
+    """Loads cleaned posts of the given flairs from the flair partitions of the text cleaner."""
+    try:
+        data = load_cleaned_partitions(flairs=flairs, remove_stopwords=remove_stopwords)
+    except FileNotFoundError as error:
+        print(error)
         return []
 
-    with open(filepath, "r", encoding="utf-8") as file:
-        data = json.load(file)
-        print(f"Loaded {len(data)} posts from {filename}.")
-        return data
+    print(f"Loaded {len(data)} posts.")
+    return data
 
 # Generate word cloud
 def generate_wordcloud_transparent(texts, output_filename, mask_path=None, palette=None):
@@ -102,8 +99,8 @@ def plot_word_frequencies(word_frequencies, output_filename, top_n=20):
 
 # Main function
 if __name__ == "__main__":
-    # Define the input file (politics with stopwords removed)
-    input_filename = "cleaned_politics_no_stopwords.json"  # Adjust as needed
+    # Define the input flairs (politics with stopwords removed)
+    input_flairs = ["Politik | Politics"]  # Adjust as needed
     mask_filename = "WordCloudMask.png"  # Name of the mask file
     output_dir = os.path.join("results", "plots")
     mask_path = os.path.join(os.getcwd(), mask_filename)  # Full path to the mask
@@ -112,8 +109,8 @@ if __name__ == "__main__":
     output_plot = os.path.join(output_dir, "word_frequencies_bar_chart.png")
 
     # Load the dataset
-    print(f"Loading cleaned posts from {input_filename}...")
-    posts = load_cleaned_posts(input_filename)
+    print(f"Loading cleaned posts with flairs {input_flairs}...")
+    posts = load_cleaned_posts(input_flairs)
 
     if not posts:
         print("No posts loaded. Exiting.")
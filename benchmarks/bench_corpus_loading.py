@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from SubRedditCorpusLoader import DAILY_FILE_PREFIX, JSON_BACKENDS, list_daily_files, load_corpus, \
+                                   get_corpus_cache_directory
+
+# Cold-load throughput (MB/s) of the daily collector files
+# Usage: python benchmarks/bench_corpus_loading.py [data directory] [workers]
+# Without a data directory, a synthetic corpus of 100 days is generated in a temporary directory.
+
+WORDS = ("die regierung österreich wien graz politik kanzler wahl budget schule the and you "
+         "something wirklich halt einfach http://example.at/article").split()
+
+
+# Generate a synthetic corpus that looks like the collector output
+def generate_corpus(directory, days=100, posts_per_day=60, comments_per_post=40):
+    random.seed(42)
+    start = date(2024, 10, 1)
+    for day_offset in range(days):
+        day = start + timedelta(days=day_offset)
+        posts = []
+        for post_index in range(posts_per_day):
+            created_utc = 1727740800 + day_offset * 86400 + post_index * 1000
+            posts.append({
+                "id": f"p{day_offset}_{post_index}",
+                "title": " ".join(random.choices(WORDS, k=8)),
+                "selftext": " ".join(random.choices(WORDS, k=random.randint(0, 200))),
+                "author": "author",
+                "created_utc": created_utc,
+                "upvotes": random.randint(0, 500),
+                "num_comments": comments_per_post,
+                "flair": random.choice(["Politik | Politics", "Memes & Humor", "Frage | Question", None]),
+                "comments": [{
+                    "id": f"c{day_offset}_{post_index}_{comment_index}",
+                    "body": " ".join(random.choices(WORDS, k=random.randint(1, 60))),
+                    "author": "commenter",
+                    "created_utc": created_utc + comment_index,
+                    "upvotes": random.randint(-5, 50)
+                } for comment_index in range(comments_per_post)]
+            })
+        with open(os.path.join(directory, f"{DAILY_FILE_PREFIX}{day}.json"), "w", encoding="utf-8") as file:
+            json.dump(posts, file)
+
+
+# The loader the scripts used before SubRedditCorpusLoader: serial json.load in os.listdir order
+def load_previous(directory):
+    posts = []
+    for filename in os.listdir(directory):
+        if filename.startswith(DAILY_FILE_PREFIX) and filename.endswith(".json"):
+            with open(os.path.join(directory, filename), "r", encoding="utf-8") as file:
+                posts.extend(json.load(file))
+    return posts
+
+
+# Run a loader a few times and report the best throughput
+def measure(name, loader, size_mb, repeats=3, before_each=None):
+    best = float("inf")
+    for _ in range(repeats):
+        if before_each is not None:
+            before_each()
+        start_time = time.perf_counter()
+        posts = loader()
+        best = min(best, time.perf_counter() - start_time)
+    print(f"{name:<38} {best:8.3f} s {size_mb / best:9.1f} MB/s  ({len(posts)} posts)")
+
+
+if __name__ == "__main__":
+    temporary_directory = None
+    if len(sys.argv) > 1:
+        data_directory = sys.argv[1]
+    else:
+        temporary_directory = tempfile.mkdtemp()
+        data_directory = temporary_directory
+        print(f"Generating synthetic corpus in {data_directory}...")
+        generate_corpus(data_directory)
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    size_mb = sum(os.path.getsize(filepath) for filepath in list_daily_files(data_directory)) / 1e6
+    cache_directory = get_corpus_cache_directory(data_directory)
+    print(f"{len(list_daily_files(data_directory))} daily files, {size_mb:.1f} MB, {workers} worker(s)\n")
+
+    # Cold loads, no cache involved
+    measure("previous loader (json.load, serial)", lambda: load_previous(data_directory), size_mb)
+    for backend in JSON_BACKENDS:
+        measure(f"load_corpus {backend}, serial", lambda: load_corpus(
+            data_directory, use_cache=False, json_backend=backend), size_mb)
+        measure(f"load_corpus {backend}, {workers} workers", lambda: load_corpus(
+            data_directory, use_cache=False, workers=workers, json_backend=backend), size_mb)
+
+    # Warm cache
+    load_corpus(data_directory)
+    measure("load_corpus, warm cache", lambda: load_corpus(data_directory), size_mb)
+
+    if temporary_directory is not None:
+        shutil.rmtree(temporary_directory)
+    elif os.path.isdir(cache_directory):
+        print(f"\nCache kept in {cache_directory}")
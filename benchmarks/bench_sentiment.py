@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import copy
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_corpus_loading import generate_corpus
+from SubRedditCorpusLoader import load_corpus, load_cleaned_partitions
+from SubRedditSentimentAnalyzer import (load_sentiment_pipeline, collect_sentiment_texts,
+                                        perform_sentiment_analysis_batched)
+
+# Throughput (texts/s) of the sentiment analysis on CPU: one pipeline call per text against batched inference
+# Usage: python benchmarks/bench_sentiment.py [number of texts]
+# Texts come from the politics partition of the text cleaner (data/cleaned). Without it, a synthetic corpus is
+# generated in a temporary directory. The model is loaded once and shared by all runs.
+BATCH_SIZES = (8, 16, 32, 64)
+
+
+# Load cleaned posts, the synthetic corpus uses its raw texts as cleaned texts
+def load_benchmark_posts():
+    try:
+        return load_cleaned_partitions(flairs=["Politik | Politics"], remove_stopwords=False)
+    except FileNotFoundError:
+        temporary_directory = tempfile.mkdtemp()
+        print(f"No cleaned data found, generating synthetic corpus in {temporary_directory}...")
+        generate_corpus(temporary_directory, days=2)
+        posts = load_corpus(temporary_directory, use_cache=False)
+        shutil.rmtree(temporary_directory)
+        for post in posts:
+            post["cleaned_title"] = post.get("title", "").lower()
+            post["cleaned_selftext"] = post.get("selftext", "").lower()
+            for comment in post.get("comments", []):
+                comment["cleaned_body"] = comment.get("body", "").lower()
+        return posts
+
+
+# Take posts until they hold the requested number of texts
+def sample_posts(posts, num_texts):
+    sample = []
+    count = 0
+    for post in posts:
+        if count >= num_texts:
+            break
+        sample.append(copy.deepcopy(post))
+        count += len(collect_sentiment_texts([post]))
+    return sample
+
+
+# Labels of all texts in the order of collect_sentiment_texts
+def get_labels(posts):
+    return [target.get("sentiment") for target, _ in collect_sentiment_texts(posts)]
+
+
+# Time a sentiment function over a copy of the sample
+def measure(name, analyze, posts):
+    posts = copy.deepcopy(posts)
+    num_texts = len(collect_sentiment_texts(posts))
+    start_time = time.perf_counter()
+    analyze(posts)
+    elapsed = time.perf_counter() - start_time
+    print(f"{name:<40} {elapsed:8.2f} s {num_texts / elapsed:10.1f} texts/s")
+    return get_labels(posts)
+
+
+if __name__ == "__main__":
+    num_texts = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    posts = sample_posts(load_benchmark_posts(), num_texts)
+    print(f"{len(collect_sentiment_texts(posts))} texts\n")
+
+    print("Loading model...")
+    sentiment_pipeline = load_sentiment_pipeline()
+
+    # perform_sentiment_analysis before batching: one call per text, cut to 512 characters
+    def per_text(sample):
+        for target, text in collect_sentiment_texts(sample):
+            target["sentiment"] = sentiment_pipeline(text[:512])[0]["label"]
+
+    previous = measure("one call per text (512 characters)", per_text, posts)
+    for batch_size in BATCH_SIZES:
+        batched = measure(f"batched, batch_size={batch_size} (512 tokens)",
+                          lambda sample: perform_sentiment_analysis_batched(sample, batch_size, sentiment_pipeline),
+                          posts)
+    # Labels only differ where 512 characters and 512 tokens cut a text differently
+    agreement = sum(1 for old, new in zip(previous, batched) if old == new) / max(len(previous), 1)
+    print(f"\nlabel agreement with the per-text run: {agreement:.1%}")
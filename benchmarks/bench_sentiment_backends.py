@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_sentiment import load_benchmark_posts
+from SubRedditSentimentAnalyzer import (load_sentiment_pipeline, collect_sentiment_texts, SENTIMENT_BACKENDS,
+                                        DEFAULT_BATCH_SIZE, MAX_TOKENS)
+
+# Agreement report of the sentiment backends: star labels of the ONNX backends against PyTorch, next to the
+# throughput (texts/s) of every backend on CPU
+# Usage: python benchmarks/bench_sentiment_backends.py [number of texts] [ONNX intra-op threads]
+# The texts are a random sample (fixed seed) of the politics partition, or of a synthetic corpus without it.
+STAR_LABELS = ["1 star", "2 stars", "3 stars", "4 stars", "5 stars"]
+
+
+# Score texts sorted by length, like perform_sentiment_analysis_batched, and return labels in the original order
+def score_texts(sentiment_pipeline, texts, batch_size=DEFAULT_BATCH_SIZE):
+    order = sorted(range(len(texts)), key=lambda index: len(texts[index]), reverse=True)
+    labels = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        results = sentiment_pipeline([texts[index] for index in batch], batch_size=batch_size, truncation=True,
+                                     max_length=MAX_TOKENS)
+        for index, result in zip(batch, results):
+            labels[index] = result["label"]
+    return labels
+
+
+# Print exact and within-one-star agreement plus the confusion matrix (rows: reference, columns: candidate)
+def print_agreement_report(name, reference_labels, candidate_labels):
+    stars = {label: position + 1 for position, label in enumerate(STAR_LABELS)}
+    pairs = list(zip(reference_labels, candidate_labels))
+    exact = sum(1 for reference, candidate in pairs if reference == candidate) / len(pairs)
+    within_one = sum(1 for reference, candidate in pairs if abs(stars[reference] - stars[candidate]) <= 1) / len(pairs)
+    mean_difference = sum(stars[candidate] - stars[reference] for reference, candidate in pairs) / len(pairs)
+
+    print(f"\n{name} against pytorch:")
+    print(f"  exact agreement: {exact:.1%}, within one star: {within_one:.1%}, "
+          f"mean star difference: {mean_difference:+.3f}")
+    print("  " + " " * 10 + "".join(f"{label:>9}" for label in STAR_LABELS))
+    for reference_label in STAR_LABELS:
+        counts = [sum(1 for reference, candidate in pairs if reference == reference_label and candidate == label)
+                  for label in STAR_LABELS]
+        print(f"  {reference_label:<10}" + "".join(f"{count:>9}" for count in counts))
+
+
+if __name__ == "__main__":
+    num_texts = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_threads = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    texts = sorted({text for _, text in collect_sentiment_texts(load_benchmark_posts())})
+    texts = random.Random(42).sample(texts, min(num_texts, len(texts)))
+    print(f"{len(texts)} texts\n")
+
+    labels = {}
+    for backend in SENTIMENT_BACKENDS:
+        sentiment_pipeline = load_sentiment_pipeline(backend, num_threads)
+        score_texts(sentiment_pipeline, texts[:DEFAULT_BATCH_SIZE])  # Warm-up
+        start_time = time.perf_counter()
+        labels[backend] = score_texts(sentiment_pipeline, texts)
+        elapsed = time.perf_counter() - start_time
+        print(f"{backend:<10} {elapsed:8.2f} s {len(texts) / elapsed:10.1f} texts/s")
+
+    for backend in SENTIMENT_BACKENDS[1:]:
+        print_agreement_report(backend, labels["pytorch"], labels[backend])
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+REPOSITORY_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+# Cold-start time of SubRedditSentimentAnalyzer, every measurement runs in a new Python process
+# Usage: python benchmarks/bench_sentiment_startup.py [repetitions]
+# Runs in a temporary directory with synthetic results and a sentiment cache that holds every text, so neither
+# the plot-only path nor the cached analysis path needs the model.
+LABELS = ["1 star", "2 stars", "3 stars", "4 stars", "5 stars"]
+BENCHMARK_COMMIT_HASH = "0" * 40  # Stands in for the resolved model revision, so no run asks the Hub
+
+COMMANDS = {
+    "import transformers + matplotlib (paid by every run before)":
+        "import transformers, matplotlib.pyplot",
+    "import SubRedditSentimentAnalyzer":
+        "import SubRedditSentimentAnalyzer",
+    "analysis, all texts cached":
+        "import json, sys, SubRedditSentimentAnalyzer as analyzer\n"
+        "data = json.load(open('posts.json', encoding='utf-8'))\n"
+        "cache = analyzer.SentimentCache()\n"
+        "analyzer.perform_sentiment_analysis_batched(data, cache=cache)\n"
+        "assert 'transformers' not in sys.modules",
+}
+
+
+# Synthetic cleaned posts, their results and a sentiment cache with all their texts
+def prepare_directory(directory, num_posts=2000, comments_per_post=20):
+    import numpy as np
+    import SubRedditSentimentAnalyzer as analyzer
+
+    posts = []
+    for post_index in range(num_posts):
+        posts.append({
+            "id": f"p{post_index}",
+            "cleaned_title": f"titel nummer {post_index}",
+            "cleaned_selftext": "",
+            "comments": [{"id": f"c{post_index}_{comment_index}",
+                          "cleaned_body": f"kommentar {post_index} {comment_index}"}
+                         for comment_index in range(comments_per_post)]
+        })
+    with open(os.path.join(directory, "posts.json"), "w", encoding="utf-8") as file:
+        json.dump(posts, file)
+
+    os.makedirs(os.path.join(directory, "results"), exist_ok=True)
+    results = json.loads(json.dumps(posts))
+    for target, text in analyzer.collect_sentiment_texts(results):
+        target["sentiment"] = LABELS[len(text) % len(LABELS)]
+    with open(os.path.join(directory, "results", "sentiment_analysis_results.json"), "w", encoding="utf-8") as file:
+        json.dump(results, file)
+
+    cache = analyzer.SentimentCache(os.path.join(directory, "data", ".cache", "sentiment_cache.sqlite"))
+    cache.set_revision(BENCHMARK_COMMIT_HASH)
+    cache.put_many([(analyzer.get_text_hash(text), LABELS[len(text) % len(LABELS)], 1.0,
+                     np.eye(len(LABELS), dtype=np.float16)[len(text) % len(LABELS)])
+                    for _, text in analyzer.collect_sentiment_texts(posts)])
+    cache.close()
+
+
+# Best wall time of a command over the repetitions
+def measure(name, arguments, directory, repetitions):
+    environment = dict(os.environ, PYTHONPATH=os.path.abspath(REPOSITORY_DIRECTORY), MPLBACKEND="Agg")
+    best = None
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        subprocess.run(arguments, cwd=directory, env=environment, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<60} {best:8.2f} s")
+
+
+if __name__ == "__main__":
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    directory = tempfile.mkdtemp()
+    prepare_directory(directory)
+
+    measure("python -c pass (interpreter)", [sys.executable, "-c", "pass"], directory, repetitions)
+    for name, code in COMMANDS.items():
+        measure(name, [sys.executable, "-c", code], directory, repetitions)
+    measure("SubRedditSentimentAnalyzer.py plot (incl. rendering)",
+            [sys.executable, os.path.join(os.path.abspath(REPOSITORY_DIRECTORY), "SubRedditSentimentAnalyzer.py"),
+             "plot"], directory, repetitions)
+
+    shutil.rmtree(directory)
@@ -0,0 +1,72 @@
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_corpus_loading import generate_corpus
+from SubRedditCorpusLoader import load_corpus
+
+# Throughput (texts/s) of the text cleaner: the previous preprocess_text against TextNormalizer
+# Usage: python benchmarks/bench_text_cleaner.py [data directory]
+# Without a data directory, a synthetic corpus of 20 days is generated in a temporary directory.
+
+# The cleaner's file name starts with a digit, so it can't be imported with a regular import statement
+spec = importlib.util.spec_from_file_location(
+    "text_cleaner", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "01_SubRedditTextCleaner.py"))
+text_cleaner = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(text_cleaner)
+
+
+# preprocess_text as it was before TextNormalizer, kept here as the reference
+def previous_preprocess_text(text, custom_stopwords=None):
+    if custom_stopwords is None:
+        custom_stopwords = set()
+    stopwords = text_cleaner.GERMAN_STOPWORDS.union(text_cleaner.ENGLISH_STOPWORDS).union(custom_stopwords)
+    text = re.sub(r'http\S+', '', text)
+    text = re.sub(r'[^a-zA-ZäöüÄÖÜß\s]', '', text)
+    text = text.lower()
+    tokens = [word for word in text.split() if word not in stopwords and len(word) > 2]
+    return " ".join(tokens)
+
+
+# Time a cleaning function over all texts
+def measure(name, clean, texts):
+    start_time = time.perf_counter()
+    results = clean(texts)
+    elapsed = time.perf_counter() - start_time
+    print(f"{name:<48} {elapsed:8.3f} s {len(texts) / elapsed:12.0f} texts/s")
+    return results
+
+
+if __name__ == "__main__":
+    temporary_directory = None
+    if len(sys.argv) > 1:
+        data_directory = sys.argv[1]
+    else:
+        temporary_directory = tempfile.mkdtemp()
+        data_directory = temporary_directory
+        print(f"Generating synthetic corpus in {data_directory}...")
+        generate_corpus(data_directory, days=20)
+
+    texts = []
+    for post in load_corpus(data_directory, use_cache=False):
+        texts.append(post.get("title", ""))
+        texts.append(post.get("selftext", ""))
+        texts.extend(comment.get("body", "") for comment in post.get("comments", []))
+    print(f"{len(texts)} texts\n")
+
+    stopwords = text_cleaner.get_multilingual_stopwords()
+    normalizer = text_cleaner.TextNormalizer(stopwords)
+    for label, custom_stopwords, current in (("with stopwords", None, text_cleaner.DEFAULT_NORMALIZER),
+                                             ("no stopwords", stopwords, normalizer)):
+        previous = measure(f"previous preprocess_text ({label})",
+                           lambda batch: [previous_preprocess_text(text, custom_stopwords) for text in batch], texts)
+        batched = measure(f"TextNormalizer.normalize_batch ({label})", current.normalize_batch, texts)
+        print(f"identical output: {previous == batched}\n")
+
+    if temporary_directory is not None:
+        shutil.rmtree(temporary_directory)
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_sentiment import load_benchmark_posts
+from sklearn.decomposition import LatentDirichletAllocation
+from gensim.models import CoherenceModel
+from SubRedditTopicModelling import TopicCorpus, CoherenceScorer, collect_topic_texts, get_topic_words
+
+# Time and agreement of the coherence measures: gensim's CoherenceModel against CoherenceScorer
+# Usage: python benchmarks/bench_topic_coherence.py [number of texts]
+# Texts come from the politics partition of the text cleaner, or from a synthetic corpus without it. The topics
+# are those of LDAs with 4, 8 and 12 topics on these texts. The scorer is timed with an empty cache for every
+# topic count (like a single run) and once for all topic counts together (like the sweep).
+TOPIC_COUNTS = (4, 8, 12)
+MEASURES = ("c_v", "c_npmi", "u_mass")
+
+
+# Coherence of gensim's CoherenceModel on the token lists and bag-of-words of the corpus
+def gensim_coherence(corpus, texts, bow, topics, measure):
+    dictionary = corpus.get_dictionary()
+    return CoherenceModel(topics=topics, texts=texts, corpus=bow, dictionary=dictionary, coherence=measure,
+                          processes=1).get_coherence()
+
+
+if __name__ == "__main__":
+    num_texts = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    texts = [text for post in load_benchmark_posts() for text in collect_topic_texts(post)][:num_texts]
+    corpus = TopicCorpus.from_texts(texts)
+    print(f"{corpus.num_documents} texts, {len(corpus.vocabulary)} tokens\n")
+
+    dtm, words = corpus.get_document_term_matrix()
+    topics = {}
+    for num_topics in TOPIC_COUNTS:
+        lda = LatentDirichletAllocation(n_components=num_topics, random_state=42).fit(dtm)
+        topics[num_topics] = list(get_topic_words(lda, words).values())
+
+    tokenized_texts = corpus.get_tokenized_texts()
+    dictionary = corpus.get_dictionary()
+    bow = [dictionary.doc2bow(text) for text in tokenized_texts]
+
+    for measure in MEASURES:
+        print(f"{measure}:")
+        for num_topics, topic_words in topics.items():
+            start_time = time.perf_counter()
+            reference = gensim_coherence(corpus, tokenized_texts, bow, topic_words, measure)
+            gensim_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            native = CoherenceScorer(corpus).coherence(topic_words, measure)
+            native_time = time.perf_counter() - start_time
+            print(f"  k={num_topics:<3} gensim {reference:9.5f} {gensim_time:8.2f} s   "
+                  f"native {native:9.5f} {native_time:8.2f} s   difference {abs(native - reference):.1e}")
+
+        start_time = time.perf_counter()
+        scorer = CoherenceScorer(corpus)
+        scorer.prepare([words for topic_words in topics.values() for words in topic_words], measure)
+        for topic_words in topics.values():
+            scorer.coherence(topic_words, measure)
+        print(f"  all topic counts with one shared count: {time.perf_counter() - start_time:.2f} s\n")
@@ -0,0 +1,287 @@
+import importlib.util
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+REPOSITORY_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Regression tests of 00_SubRedditDataCollector.py against a stub of the Reddit API
+# FakeReddit serves the "new" listing of a fixed list of submissions page by page and the comments of a
+# submission by id, and records which thread used which instance. No request leaves the machine.
+
+# praw.Reddit is created when the module is imported, it only needs credentials to be set
+for variable in ("REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_USERNAME", "REDDIT_PASSWORD"):
+    os.environ.setdefault(variable, "test")
+
+spec = importlib.util.spec_from_file_location("collector", os.path.join(REPOSITORY_DIRECTORY,
+                                                                         "00_SubRedditDataCollector.py"))
+collector = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(collector)
+
+SUBREDDIT_NAME = "austria"
+COMMENTS_PER_SUBMISSION = 3
+
+
+class FakeAuthor:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeComment:
+    def __init__(self, submission_id, index, created_utc):
+        self.id = f"{submission_id}_c{index}"
+        self.body = f"comment {index} of {submission_id}"
+        self.author = FakeAuthor(f"user{index}")
+        self.created_utc = created_utc + index
+        self.score = index
+
+
+class FakeComments:
+    def __init__(self, reddit, submission):
+        self.reddit = reddit
+        self.submission = submission
+
+    def replace_more(self, limit=0):
+        pass
+
+    def list(self):
+        self.reddit.record_comment_fetch(self.submission.id)
+        # Uneven delays, so the comment trees of a day finish out of listing order
+        time.sleep(self.reddit.comment_delay * (int(self.submission.id[1:]) % 4))
+        return [FakeComment(self.submission.id, index, self.submission.created_utc)
+                for index in range(COMMENTS_PER_SUBMISSION)]
+
+
+class FakeSubmission:
+    def __init__(self, reddit, submission_id, created_utc):
+        self.reddit = reddit
+        self.id = submission_id
+        self.fullname = f"t3_{submission_id}"
+        self.title = f"title of {submission_id}"
+        self.selftext = f"text of {submission_id}"
+        self.author = FakeAuthor("author") if int(submission_id[1:]) % 3 else None
+        self.created_utc = created_utc
+        self.score = int(submission_id[1:])
+        self.num_comments = COMMENTS_PER_SUBMISSION
+        self.link_flair_text = "Politik | Politics" if int(submission_id[1:]) % 2 else None
+
+    @property
+    def comments(self):
+        return FakeComments(self.reddit, self)
+
+
+class FakeSubreddit:
+    def __init__(self, reddit):
+        self.reddit = reddit
+
+    def new(self, limit=100, params=None):
+        self.reddit.listing_requests += 1
+        after = (params or {}).get("after")
+        fullnames = [f"t3_{submission_id}" for submission_id, _ in self.reddit.submissions]
+        start = fullnames.index(after) + 1 if after else 0
+        return iter([FakeSubmission(self.reddit, submission_id, created_utc)
+                     for submission_id, created_utc in self.reddit.submissions[start:start + limit]])
+
+
+# Stub of praw.Reddit, submissions are (id, created_utc) from newest to oldest like the "new" listing
+class FakeReddit:
+    def __init__(self, submissions, comment_delay=0.0, shared=None):
+        self.submissions = submissions
+        self.by_id = dict(submissions)
+        self.comment_delay = comment_delay
+        self.listing_requests = 0
+        self.threads = set()  # Threads that fetched comments through this instance
+        self.shared = shared if shared is not None else {"lock": threading.Lock(), "comment_fetches": []}
+
+    def subreddit(self, name):
+        return FakeSubreddit(self)
+
+    def submission(self, id):
+        with self.shared["lock"]:
+            self.threads.add(threading.get_ident())
+        return FakeSubmission(self, id, self.by_id[id])
+
+    def record_comment_fetch(self, submission_id):
+        with self.shared["lock"]:
+            self.shared["comment_fetches"].append(submission_id)
+
+
+# Stub API: the main thread's instance plus one per comment worker, all serving the same submissions
+class FakeApi:
+    def __init__(self, submissions, comment_delay=0.0):
+        self.main = FakeReddit(submissions, comment_delay)
+        self.workers = []
+
+    def create_reddit(self):
+        worker = FakeReddit(self.main.submissions, self.main.comment_delay, self.main.shared)
+        self.workers.append(worker)
+        return worker
+
+    @property
+    def comment_fetches(self):
+        return self.main.shared["comment_fetches"]
+
+
+# Submissions from newest to oldest, spaced so that every day gets several of them
+def make_submissions(count, newest_created_utc, spacing=5000, first_index=0):
+    return [(f"s{first_index + index}", newest_created_utc - index * spacing) for index in range(count)]
+
+
+# Run the collector in the current directory against a stub API
+def run_collector(monkeypatch, submissions, start_date, end_date, comment_delay=0.0, **kwargs):
+    api = FakeApi(submissions, comment_delay)
+    monkeypatch.setattr(collector, "reddit", api.main)
+    monkeypatch.setattr(collector, "create_reddit", api.create_reddit)
+    monkeypatch.setattr(collector, "rate_limiter", collector.AdaptiveRateLimiter(default_rate=1e6))
+    collector.fetch_submissions_with_comments(SUBREDDIT_NAME, start_date, end_date, **kwargs)
+    return api
+
+
+# Contents of the daily files in "data"
+def read_day_files(directory="data"):
+    day_files = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.startswith(f"{SUBREDDIT_NAME}_posts_with_comments_"):
+            with open(os.path.join(directory, filename), "rb") as file:
+                day_files[filename] = file.read()
+    return day_files
+
+
+@pytest.fixture
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.mark.parametrize("output_format", ["json", "ndjson"])
+def test_parallel_fetch_writes_the_same_files_as_a_serial_fetch(in_tmp_path, monkeypatch, output_format):
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=4)
+    submissions = make_submissions(120, end_date.timestamp() - 60)
+
+    day_files = {}
+    for workers in (1, 6):
+        directory = in_tmp_path / f"workers_{workers}"
+        directory.mkdir()
+        monkeypatch.chdir(directory)
+        run_collector(monkeypatch, submissions, start_date, end_date, comment_delay=0.002, p_max_workers=workers,
+                      p_incremental=False, p_output_format=output_format)
+        day_files[workers] = read_day_files()
+
+    assert len(day_files[1]) >= 4
+    assert day_files[6] == day_files[1]
+
+    # Posts keep the listing order (newest first) inside every day and carry all of their comments
+    for filename in day_files[6]:
+        day = filename[len(f"{SUBREDDIT_NAME}_posts_with_comments_"):].rsplit(".", 1)[0]
+        posts = collector.load_day_posts(SUBREDDIT_NAME, day)
+        assert posts
+        assert [post["created_utc"] for post in posts] == sorted((post["created_utc"] for post in posts),
+                                                                 reverse=True)
+        assert all(len(post["comments"]) == COMMENTS_PER_SUBMISSION for post in posts)
+
+
+def test_every_comment_worker_uses_its_own_reddit_instance(in_tmp_path, monkeypatch):
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=3)
+    submissions = make_submissions(80, end_date.timestamp() - 60)
+    api = run_collector(monkeypatch, submissions, start_date, end_date, comment_delay=0.002, p_max_workers=4,
+                        p_incremental=False)
+
+    assert api.comment_fetches
+    assert 1 <= len(api.workers) <= 4
+    assert not api.main.threads  # The main thread's instance only serves the listing
+    assert all(len(worker.threads) <= 1 for worker in api.workers)
+    used_threads = [thread for worker in api.workers for thread in worker.threads]
+    assert len(used_threads) == len(set(used_threads))
+
+
+# Submissions of today (before now) and of the days_back days before, four per day, newest first
+# today_fractions place today's submissions between midnight (0.0) and now (1.0).
+def make_daily_submissions(today_start, now, days_back=4, today_fractions=(0.5, 0.4, 0.3, 0.2), first_index=0):
+    times = [today_start.timestamp() + (now.timestamp() - today_start.timestamp()) * fraction
+             for fraction in today_fractions]
+    for days_ago in range(1, days_back + 1):
+        day_start = today_start - timedelta(days=days_ago)
+        times.extend((day_start + timedelta(hours=hour)).timestamp() for hour in (20, 15, 10, 5))
+    return [(f"s{first_index + index}", created_utc) for index, created_utc in enumerate(times)]
+
+
+# Ids of the posts of every day file
+def read_day_post_ids():
+    post_ids = {}
+    for filename in read_day_files():
+        day = filename[len(f"{SUBREDDIT_NAME}_posts_with_comments_"):].rsplit(".", 1)[0]
+        post_ids[day] = [post["id"] for post in collector.load_day_posts(SUBREDDIT_NAME, day)]
+    return post_ids
+
+
+@pytest.fixture
+def daily_range():
+    now = datetime.now()
+    today_start = datetime.combine(now.date(), datetime.min.time())
+    return today_start, now, today_start - timedelta(days=3)
+
+
+def test_completed_days_are_skipped(in_tmp_path, monkeypatch, daily_range):
+    today_start, now, start_date = daily_range
+    submissions = make_daily_submissions(today_start, now)
+    run_collector(monkeypatch, submissions, start_date, now)
+    first_files = read_day_files()
+    assert len(first_files) == 4
+
+    state = collector.load_collector_state(SUBREDDIT_NAME)
+    assert state["completed_days"] == [str((today_start - timedelta(days=days_ago)).date()) for days_ago in (3, 2, 1)]
+
+    # Nothing new: only today is crawled, it stops at the high-water mark right away and nothing is written
+    api = run_collector(monkeypatch, submissions, start_date, now)
+    assert api.main.listing_requests == 1
+    assert api.comment_fetches == []
+    assert read_day_files() == first_files
+
+
+def test_same_day_rerun_stops_at_the_high_water_mark_and_keeps_earlier_posts(in_tmp_path, monkeypatch, daily_range):
+    today_start, now, start_date = daily_range
+    submissions = make_daily_submissions(today_start, now)
+    run_collector(monkeypatch, submissions, start_date, now)
+    first_post_ids = read_day_post_ids()
+    first_files = read_day_files()
+
+    new_submissions = make_daily_submissions(today_start, now, days_back=0, today_fractions=(0.8, 0.7, 0.6),
+                                             first_index=100)
+    api = run_collector(monkeypatch, new_submissions + submissions, start_date, now)
+
+    # Only the new submissions are fetched, the listing isn't followed past the high-water mark
+    assert api.main.listing_requests == 1
+    assert sorted(api.comment_fetches) == sorted(submission_id for submission_id, _ in new_submissions)
+    assert collector.load_collector_state(SUBREDDIT_NAME)["newest_created_utc"] == new_submissions[0][1]
+
+    # Today is merged: the new posts first, then the posts of the first run
+    today = str(now.date())
+    post_ids = read_day_post_ids()
+    assert post_ids[today] == [submission_id for submission_id, _ in new_submissions] + first_post_ids[today]
+    assert {filename: content for filename, content in read_day_files().items() if today not in filename} == \
+           {filename: content for filename, content in first_files.items() if today not in filename}
+
+
+@pytest.mark.parametrize("output_format", ["json", "ndjson"])
+def test_days_beyond_the_listing_are_merged_and_never_truncated(in_tmp_path, monkeypatch, daily_range, output_format):
+    today_start, now, start_date = daily_range
+    submissions = make_daily_submissions(today_start, now)
+    run_collector(monkeypatch, submissions, start_date, now, p_output_format=output_format)
+    first_post_ids = read_day_post_ids()
+
+    # Every day counts as incomplete again, but the listing only reaches two posts of yesterday
+    state = collector.load_collector_state(SUBREDDIT_NAME)
+    state["completed_days"] = []
+    collector.save_collector_state(SUBREDDIT_NAME, state)
+    api = run_collector(monkeypatch, submissions[:6], start_date, now, p_output_format=output_format)
+    assert len(api.comment_fetches) == 6
+
+    # Yesterday keeps the posts it didn't receive again, older days are left as they are
+    assert read_day_post_ids() == first_post_ids
+    assert all(filename.endswith(f".{output_format}") for filename in read_day_files())
+    assert collector.load_collector_state(SUBREDDIT_NAME)["completed_days"] == []